@@ -0,0 +1,149 @@
+"""Micro-benchmark: single-pass extract_post_fields vs the old extract_* chain
+
+Run from the repo root:
+    python benchmarks/bench_extract.py
+"""
+
+import os
+import re
+import sys
+import random
+import tempfile
+import timeit
+from typing import List
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+# main.py creates its database and log files in the working directory
+os.chdir(tempfile.mkdtemp(prefix="bench_extract_"))
+
+import main  # noqa: E402
+
+# =============================================================================
+# OLD EXTRACTORS (one scan per field)
+# =============================================================================
+
+def old_extract_size(content: str) -> str:
+    match = re.search(r'(\d+\.?\d*)\s*(GB|MB|TB)', content, re.IGNORECASE)
+    if match:
+        return f"{match.group(1)} {match.group(2).upper()}"
+    return "N/A"
+
+
+def old_extract_gdrive_links(content: str) -> List[str]:
+    links = []
+    links.extend(re.findall(r'https?://drive\.google\.com/uc\?[^"\'<>\s]+', content))
+    links.extend(re.findall(r'https?://drive\.google\.com/file/d/[^"\'<>\s/]+', content))
+
+    clean_links = []
+    for link in links:
+        link = link.replace('&amp;', '&')
+        id_match = re.search(r'[?&]id=([a-zA-Z0-9_-]+)', link)
+        if id_match:
+            clean_links.append(f"https://drive.google.com/uc?export=download&id={id_match.group(1)}")
+            continue
+        id_match = re.search(r'/d/([a-zA-Z0-9_-]+)', link)
+        if id_match:
+            clean_links.append(f"https://drive.google.com/uc?export=download&id={id_match.group(1)}")
+            continue
+        clean_links.append(link)
+
+    return list(dict.fromkeys(clean_links))
+
+
+def old_extract_password(content: str) -> str:
+    for pattern in [r'password[:\s]+([^\s<]+)', r'Password[:\s]+([^\s<]+)', r'PASSWORD[:\s]+([^\s<]+)']:
+        match = re.search(pattern, content)
+        if match:
+            return match.group(1)
+    return "www.gamesleech.com"
+
+
+def old_extract_poster(content: str) -> str:
+    match = re.search(r'<img[^>]+src=["\']([^"\']+)["\']', content)
+    if match:
+        poster = match.group(1)
+        if poster.startswith('//'):
+            poster = 'https:' + poster
+        return poster
+    return ""
+
+
+def old_extract_all(content: str) -> dict:
+    return {
+        'gdrive_links': old_extract_gdrive_links(content),
+        'password': old_extract_password(content),
+        'size': old_extract_size(content),
+        'poster': old_extract_poster(content)
+    }
+
+# =============================================================================
+# SAMPLE POSTS
+# =============================================================================
+
+LOREM = (
+    "Explore a vast open world full of side quests, hidden secrets and dynamic "
+    "weather. Build your squad, upgrade your gear and take on the campaign solo "
+    "or in co-op with up to four players. "
+)
+
+
+def drive_id(rng: random.Random) -> str:
+    return "".join(rng.choices("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789_-", k=33))
+
+
+def make_post(rng: random.Random, parts: int, password_label: str) -> str:
+    """Rendered content shaped like a GamesLeech post"""
+    body = [
+        f'<p><img loading="lazy" class="aligncenter" src="//gamesleech.com/wp-content/uploads/{rng.randint(1000, 9999)}.jpg" alt="poster" width="460" height="215" /></p>',
+        f"<h2>Game Overview</h2><p>{LOREM * rng.randint(4, 12)}</p>",
+        "<h3>Repack Features</h3><ul>"
+        + "".join(f"<li>{LOREM[:rng.randint(40, 120)]}</li>" for _ in range(rng.randint(4, 10)))
+        + "</ul>",
+        "<h3>System Requirements</h3><ul><li>OS: Windows 10 64-bit</li>"
+        f"<li>Memory: {rng.choice([8, 16, 32])} GB RAM</li>"
+        "<li>Graphics: GTX 1060 6GB / RX 580 8GB</li>"
+        f"<li>Storage: {rng.randint(20, 150)} GB available space</li></ul>",
+        f"<p><strong>{password_label}:</strong> www.gamesleech.com</p>",
+        "<h3>Download Links</h3><p>",
+    ]
+
+    for part in range(1, parts + 1):
+        if part % 2:
+            body.append(f'<a href="https://drive.google.com/uc?export=download&amp;id={drive_id(rng)}">Part {part}</a><br />')
+        else:
+            body.append(f'<a href="https://drive.google.com/file/d/{drive_id(rng)}/view?usp=sharing">Part {part}</a><br />')
+
+    body.append(f"</p><p>{LOREM * rng.randint(2, 6)}</p>")
+    return "\n".join(body)
+
+
+def main_bench():
+    rng = random.Random(42)
+    posts = [
+        make_post(rng, rng.randint(1, 12), rng.choice(["password", "Password", "PASSWORD"]))
+        for _ in range(50)
+    ]
+
+    # Both implementations must agree before timing them
+    for content in posts:
+        assert main.extract_post_fields(content) == old_extract_all(content)
+
+    avg_kb = sum(len(p) for p in posts) / len(posts) / 1024
+    number = 20
+
+    old_time = timeit.timeit(lambda: [old_extract_all(p) for p in posts], number=number)
+    new_time = timeit.timeit(lambda: [main.extract_post_fields(p) for p in posts], number=number)
+
+    per_post_old = old_time / (number * len(posts)) * 1e6
+    per_post_new = new_time / (number * len(posts)) * 1e6
+
+    print(f"Posts: {len(posts)} (avg {avg_kb:.1f} KB)")
+    print(f"extract_* chain:     {per_post_old:8.1f} us/post")
+    print(f"extract_post_fields: {per_post_new:8.1f} us/post")
+    print(f"Speedup:             {per_post_old / per_post_new:8.2f}x")
+
+
+if __name__ == "__main__":
+    main_bench()
@@ -1,16 +1,25 @@
 import re
 import json
 import asyncio
-import requests
+import httpx
 import os
 import random
 import time
 import hashlib
+import hmac
+import sqlite3
+import bisect
+import sys
+import signal
+import struct
+import contextvars
+from array import array
 from typing import Optional, Dict, List, Any
 from datetime import datetime, timedelta
 from pathlib import Path
+from urllib.parse import urlsplit
 import logging
-from collections import defaultdict
+from collections import defaultdict, deque, OrderedDict
 
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (
@@ -18,6 +27,7 @@ from telegram.ext import (
     CommandHandler,
     MessageHandler,
     CallbackQueryHandler,
+    BaseUpdateProcessor,
     filters,
     ContextTypes
 )
@@ -34,13 +44,94 @@ OWNER_IDS = [7899148519]  # Apna Telegram ID daal
 # API Configuration
 API_BASE = "https://gamesleech.com/wp-json/wp/v2"
 BACKUP_API_BASE = "https://gamesleech.net/wp-json/wp/v2"  # Backup API
+API_MAX_CONNECTIONS = 20  # Pooled keep-alive connections
+API_RATE = 1.0  # Requests per second per upstream host
+API_BURST = 3  # Requests allowed back to back after idle time
+API_HOST_LIMITS = {}  # host -> (rate, burst) overrides
+CIRCUIT_WINDOW = 60  # Seconds of request outcomes per breaker
+CIRCUIT_MIN_REQUESTS = 5  # Outcomes needed before a breaker can open
+CIRCUIT_ERROR_RATE = 0.5  # Failure share that opens a breaker
+CIRCUIT_OPEN_SECONDS = 30  # Cool-down before a half-open probe
+SEARCH_FANOUT = True  # Run search fallback queries concurrently
+SEARCH_FANOUT_CONCURRENCY = 3
+API_FIELD_PROJECTION = True  # Request only needed fields with _fields
+
+# WordPress _fields projections per view
+POST_FIELDS = "id,title,link,date,modified,content"
+LIST_FIELDS = "id,title,date,modified,content"
+SEARCH_FIELDS = "id,title,link,date,modified,categories"
+SYNC_FIELDS = "id,title,link,date,modified,categories"
+
+# API Response Cache
+API_CACHE_MAX_BYTES = 32 * 1024 * 1024  # 32 MB
+API_CACHE_TTL_POST = 3600  # /posts/{id}
+API_CACHE_TTL_SEARCH = 600  # /posts?search=
+API_CACHE_TTL_LIST = 120  # /posts?orderby=date (latest / category)
+
+# Catalog Index
+CATALOG_INDEX_PATH = "catalog_index.json"
+CATALOG_SYNC_INTERVAL = 600  # Seconds
+CATALOG_SYNC_PAGE_SIZE = 100  # WordPress max per_page
+CATALOG_SYNC_MAX_PAGES = 5  # Per sync run
+FUZZY_MIN_TOKEN_LENGTH = 3  # Shorter words must match exactly
+FUZZY_MIN_SIMILARITY = 0.4  # Trigram Dice coefficient
+
+# Game Detail Cache
+GAME_CACHE_PATH = "game_details_cache.json"
+GAME_CACHE_MAX_ENTRIES = 5000
+GAME_CACHE_MAX_AGE = 86400  # Seconds, when the catalogue doesn't know the post
+
+# Detail Prefetch
+PREFETCH_ENABLED = True
+PREFETCH_TOP_N = 3  # Results warmed per list shown
+PREFETCH_CONCURRENCY = 2  # Prefetches in flight across all users
+
+# Update Processing
+UPDATE_CONCURRENCY = 32  # Updates handled at once, each user's still in order
+UPDATE_MAX_PENDING = 1024  # Updates admitted at once, queued per user or running
+
+# Webhook (alternative to long polling)
+WEBHOOK_ENABLED = False
+WEBHOOK_LISTEN = "0.0.0.0"
+WEBHOOK_PORT = 8443
+WEBHOOK_PATH = "/telegram"
+WEBHOOK_URL = ""  # Public base URL to register with setWebhook, empty to skip
+WEBHOOK_SECRET = ""  # Empty: derived from BOT_TOKEN
+WEBHOOK_WORKERS = 8  # Telegram's max_connections for webhook delivery
+WEBHOOK_MAX_BODY = 1024 * 1024  # Bytes
 
 # Database Paths
 DB_PATH = "database.json"
 LOGS_PATH = "bot_logs.txt"
 PREMIUM_DB = "premium_users.json"
 SEARCH_HISTORY_DB = "search_history.json"
+SEARCH_HISTORY_JOURNAL = "search_history.jsonl"  # Appended per search, compacted into SEARCH_HISTORY_DB
 USER_STATS_DB = "user_stats.json"
+STATS_JOURNAL = "stats_journal.jsonl"  # Counter updates not yet flushed
+STATS_SEQ_KEY = "_stats_seq"  # Journal position absorbed by USER_STATS_DB
+
+# Database Backend
+DB_BACKEND = "sqlite"  # "sqlite" or "json" (legacy)
+SQLITE_DB_PATH = "bot_data.db"
+SEARCH_HISTORY_LIMIT = 100  # Per user
+HISTORY_COMPACT_LINES = 5000  # Journal lines before compaction
+JSON_WRITE_BACK = False  # Keep JSON documents in memory, flush periodically
+DB_FLUSH_INTERVAL = 30  # Seconds
+LAST_ACTIVE_FLUSH_INTERVAL = 60  # Seconds between batched last_active writes
+
+# Sessions
+SESSION_TTL_MINUTES = 30
+SESSION_WHEEL_TICK = 60  # Seconds per timing wheel slot
+SESSION_MAX_BYTES = 8 * 1024 * 1024  # 8 MB across all sessions
+SESSION_TITLE_LENGTH = 50  # Chars kept per result title
+SESSION_BACKEND = "memory"  # "memory", "kv" (Redis-compatible server) or "local-kv" (in-process stand-in)
+SESSION_KV_HOST = "127.0.0.1"
+SESSION_KV_PORT = 6379
+SESSION_KV_PREFIX = "session:"
+
+# Progress Messages
+SHOW_PROGRESS = True  # Post a progress message while a slow fetch is pending
+PROGRESS_DELAY = 0.5  # Seconds before a pending fetch counts as slow
 
 # Limits
 FREE_USER_LIMIT = 5
@@ -90,24 +181,155 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # =============================================================================
-# DATABASE MANAGER CLASS
+# FILE HELPERS
 # =============================================================================
 
-class DatabaseManager:
-    """Handle all database operations"""
+def write_json_atomic(filepath, data, indent=2):
+    """Write JSON to a temp file and swap it in"""
+    tmp_path = f"{filepath}.tmp"
+    
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=indent)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, filepath)
+        return True
+    except Exception as e:
+        logger.error(f"Error saving {filepath}: {e}")
+        return False
+
+
+def read_journal(filepath):
+    """Read JSON lines, skipping a torn last line"""
+    entries = []
+    
+    if not os.path.exists(filepath):
+        return entries
+    
+    with open(filepath, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                logger.error(f"Skipping bad line in {filepath}")
+    
+    return entries
+
+# =============================================================================
+# STATS BUFFER
+# =============================================================================
+
+class StatsBuffer:
+    """Counter deltas held in memory and journaled until flushed into the database"""
+    
+    def __init__(self, applied_seq: int = 0, user_stats_seq: int = None, journal_path: str = STATS_JOURNAL):
+        self.journal_path = journal_path
+        
+        # Searches and per-user stats may live in separately written documents
+        if user_stats_seq is None:
+            user_stats_seq = applied_seq
+        
+        self.seq = max(applied_seq, user_stats_seq)
+        self._reset()
+        
+        # Replay what the database hasn't absorbed yet
+        for entry in read_journal(journal_path):
+            applied = applied_seq if entry["kind"] == "search" else user_stats_seq
+            if entry["seq"] > applied:
+                self._apply(entry)
+        
+        self._journal = open(journal_path, 'a', encoding='utf-8')
+    
+    def _reset(self):
+        self.searches = 0
+        self.reset_user_stats()
+    
+    def reset_user_stats(self):
+        """Drop per-user deltas once their document is written"""
+        self.downloads = defaultdict(int)  # user_id_str -> pending downloads
+        self.last_download = {}  # user_id_str -> timestamp
+        self.favorites = defaultdict(list)  # user_id_str -> new favorites
+    
+    def _apply(self, entry: dict):
+        self.seq = max(self.seq, entry["seq"])
+        kind = entry["kind"]
+        user_id_str = entry["user_id"]
+        
+        if kind == "search":
+            self.searches += 1
+        elif kind == "download":
+            self.downloads[user_id_str] += 1
+            self.last_download[user_id_str] = entry["time"]
+        elif kind == "favorite":
+            if entry["value"] not in self.favorites[user_id_str]:
+                self.favorites[user_id_str].append(entry["value"])
+    
+    def record(self, kind: str, user_id: int = None, value: Any = None):
+        """Count one event: search, download or favorite"""
+        entry = {
+            "seq": self.seq + 1,
+            "kind": kind,
+            "user_id": None if user_id is None else str(user_id),
+            "value": value,
+            "time": str(datetime.now())
+        }
+        
+        try:
+            self._journal.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self._journal.flush()
+        except Exception as e:
+            logger.error(f"Error writing {self.journal_path}: {e}")
+        
+        self._apply(entry)
+    
+    def pending(self) -> bool:
+        """Check if any deltas wait for a flush"""
+        return bool(self.searches or self.downloads or self.favorites)
+    
+    def clear(self):
+        """Drop deltas the database now holds and start a new journal"""
+        self._reset()
+        
+        with open(self.journal_path, 'w', encoding='utf-8'):
+            pass
+
+# =============================================================================
+# DATABASE MANAGER CLASS (LEGACY JSON)
+# =============================================================================
+
+class JSONDatabaseManager:
+    """Handle all database operations on the legacy JSON files"""
     
     def __init__(self):
         self.db_path = DB_PATH
         self.premium_path = PREMIUM_DB
         self.history_path = SEARCH_HISTORY_DB
         self.stats_path = USER_STATS_DB
+        self.write_back = JSON_WRITE_BACK
+        self._cache = {}
+        self._dirty = set()
         self._init_databases()
+        self._premium = set(self._load_json(self.premium_path).get("premium_users", []))
+        self.stats_buffer = StatsBuffer(
+            self._load_json(self.db_path).get("stats_seq", 0),
+            self._load_json(self.stats_path).get(STATS_SEQ_KEY, 0)
+        )
+        self._last_active = {}  # user_id_str -> timestamp not yet written
+        self._last_active_flushed = time.monotonic()
+        
+        # Search history: snapshot plus journal replayed into per-user ring buffers
+        self.journal_path = SEARCH_HISTORY_JOURNAL
+        self._history = defaultdict(lambda: deque(maxlen=SEARCH_HISTORY_LIMIT))
+        self._journal_lines = 0
+        self._load_history()
+        self._journal = open(self.journal_path, 'a', encoding='utf-8')
     
     def _init_databases(self):
         """Initialize all databases"""
         # Main database
         if not os.path.exists(self.db_path):
-            self._save_json(self.db_path, {
+            self._write_json_atomic(self.db_path, {
                 "users": {},
                 "total_searches": 0,
                 "bot_started": str(datetime.now()),
@@ -116,37 +338,144 @@ class DatabaseManager:
         
         # Premium users database
         if not os.path.exists(self.premium_path):
-            self._save_json(self.premium_path, {
+            self._write_json_atomic(self.premium_path, {
                 "premium_users": [],
                 "total_premium": 0
             })
         
         # Search history database
         if not os.path.exists(self.history_path):
-            self._save_json(self.history_path, {})
+            self._write_json_atomic(self.history_path, {})
         
         # User stats database
         if not os.path.exists(self.stats_path):
-            self._save_json(self.stats_path, {})
+            self._write_json_atomic(self.stats_path, {})
     
     def _load_json(self, filepath):
-        """Load JSON file"""
+        """Load JSON file (served from memory in write-back mode)"""
+        if self.write_back and filepath in self._cache:
+            return self._cache[filepath]
+        
         try:
             with open(filepath, 'r', encoding='utf-8') as f:
-                return json.load(f)
+                data = json.load(f)
         except Exception as e:
             logger.error(f"Error loading {filepath}: {e}")
             return {}
+        
+        if self.write_back:
+            self._cache[filepath] = data
+        
+        return data
     
     def _save_json(self, filepath, data):
-        """Save JSON file"""
-        try:
-            with open(filepath, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
+        """Save JSON file (marked dirty in write-back mode)"""
+        if self.write_back:
+            self._cache[filepath] = data
+            self._dirty.add(filepath)
             return True
-        except Exception as e:
-            logger.error(f"Error saving {filepath}: {e}")
+        
+        return self._write_json_atomic(filepath, data)
+    
+    def _write_json_atomic(self, filepath, data):
+        """Write JSON to a temp file and swap it in"""
+        return write_json_atomic(filepath, data)
+    
+    def _write_document(self, filepath, data):
+        """Write a document to disk now, even in write-back mode"""
+        if not self._write_json_atomic(filepath, data):
+            return False
+        
+        if self.write_back:
+            self._cache[filepath] = data
+            self._dirty.discard(filepath)
+        
+        return True
+    
+    def _flush_stats(self):
+        """Fold buffered counter deltas into the JSON documents"""
+        buffer = self.stats_buffer
+        
+        if not buffer.pending():
+            return False
+        
+        # Deltas go into copies, the cached documents only change once on disk
+        if buffer.downloads or buffer.favorites:
+            stats = dict(self._load_json(self.stats_path))
+            
+            for user_id_str in set(buffer.downloads) | set(buffer.favorites):
+                user_stats = dict(stats.get(user_id_str) or {
+                    "downloads": 0,
+                    "favorites": [],
+                    "last_download": None
+                })
+                user_stats["favorites"] = list(user_stats["favorites"])
+                
+                if user_id_str in buffer.downloads:
+                    user_stats["downloads"] += buffer.downloads[user_id_str]
+                    user_stats["last_download"] = buffer.last_download[user_id_str]
+                
+                for value in buffer.favorites.get(user_id_str, []):
+                    if value not in user_stats["favorites"]:
+                        user_stats["favorites"].append(value)
+                
+                stats[user_id_str] = user_stats
+            
+            # Each document records the journal position it has absorbed
+            stats[STATS_SEQ_KEY] = buffer.seq
+            
+            if not self._write_document(self.stats_path, stats):
+                return False
+            
+            buffer.reset_user_stats()
+        
+        db = dict(self._load_json(self.db_path))
+        db["total_searches"] = db.get("total_searches", 0) + buffer.searches
+        db["stats_seq"] = buffer.seq
+        
+        if not self._write_document(self.db_path, db):
+            return False
+        
+        # Both documents are on disk, the journal can go
+        buffer.clear()
+        return True
+    
+    def _flush_last_active(self):
+        """Write pending last_active times in one save"""
+        self._last_active_flushed = time.monotonic()
+        
+        if not self._last_active:
             return False
+        
+        db = self._load_json(self.db_path)
+        
+        for user_id_str, last_active in self._last_active.items():
+            if user_id_str in db["users"]:
+                db["users"][user_id_str]["last_active"] = last_active
+        
+        if not self._save_json(self.db_path, db):
+            return False
+        
+        self._last_active.clear()
+        return True
+    
+    def flush(self, force: bool = False):
+        """Write buffered counters and dirty documents, compact a long history journal"""
+        if force or time.monotonic() - self._last_active_flushed >= LAST_ACTIVE_FLUSH_INTERVAL:
+            self._flush_last_active()
+        
+        self._flush_stats()
+        flushed = 0
+        
+        for filepath in list(self._dirty):
+            if self._write_json_atomic(filepath, self._cache[filepath]):
+                self._dirty.discard(filepath)
+                flushed += 1
+        
+        if self._journal_lines >= HISTORY_COMPACT_LINES and self.compact_history():
+            flushed += 1
+        
+        return flushed
     
     def add_user(self, user_id: int, user_data: dict):
         """Add or update user in database"""
@@ -169,69 +498,112 @@ class DatabaseManager:
                 "is_banned": False,
                 "language": "en"
             }
-        else:
-            db["users"][user_id_str]["last_active"] = str(datetime.now())
+            self._save_json(self.db_path, db)
+            return db["users"][user_id_str]
         
-        self._save_json(self.db_path, db)
-        return db["users"][user_id_str]
+        # Known user: last_active is written in coalesced batches
+        self._last_active[user_id_str] = str(datetime.now())
+        return dict(db["users"][user_id_str], last_active=self._last_active[user_id_str])
     
     def get_user(self, user_id: int):
         """Get user from database"""
         db = self._load_json(self.db_path)
-        return db.get("users", {}).get(str(user_id))
+        user = db.get("users", {}).get(str(user_id))
+        
+        if user is not None and str(user_id) in self._last_active:
+            user = dict(user, last_active=self._last_active[str(user_id)])
+        
+        return user
     
-    def update_user_searches(self, user_id: int):
-        """Update user search count"""
+    def consume_search_quota(self, user_id: int):
+        """Check the daily limit and count a search in one step"""
+        is_premium = user_id in self._premium
         db = self._load_json(self.db_path)
-        user_id_str = str(user_id)
+        user = db.get("users", {}).get(str(user_id))
         
-        if user_id_str in db["users"]:
-            user = db["users"][user_id_str]
-            
-            # Check if need to reset daily limit
-            last_reset = datetime.fromisoformat(user["last_reset"])
-            if last_reset.date() < datetime.now().date():
-                user["daily_searches"] = 0
-                user["last_reset"] = str(datetime.now().date())
+        if user is None:
+            return True, "unlimited" if is_premium else FREE_USER_LIMIT
+        
+        # Reset daily limit if needed
+        today = datetime.now().date()
+        if datetime.fromisoformat(user["last_reset"]).date() < today:
+            user["daily_searches"] = 0
+            user["last_reset"] = str(today)
+        
+        if not is_premium and user["daily_searches"] >= FREE_USER_LIMIT:
+            return False, 0
+        
+        user["daily_searches"] += 1
+        user["total_searches"] += 1
+        
+        self._save_json(self.db_path, db)
+        self.stats_buffer.record("search")
+        
+        if is_premium:
+            return True, "unlimited"
+        
+        return True, FREE_USER_LIMIT - user["daily_searches"]
+    
+    def _load_history(self):
+        """Build the history index from the snapshot and journal"""
+        snapshot = self._load_json(self.history_path)
+        self._cache.pop(self.history_path, None)  # Served from the index from now on
+        
+        for user_id_str, searches in snapshot.items():
+            self._history[user_id_str].extend(searches)
+        
+        journal = read_journal(self.journal_path)
+        
+        for entry in journal:
+            searches = self._history[entry.pop("user_id")]
             
-            user["daily_searches"] += 1
-            user["total_searches"] += 1
-            db["total_searches"] = db.get("total_searches", 0) + 1
+            # Entries already in the snapshot if a compaction was cut short
+            if searches and entry["timestamp"] <= searches[-1]["timestamp"]:
+                continue
             
-            self._save_json(self.db_path, db)
-            return user["daily_searches"]
+            searches.append(entry)
         
-        return 0
+        if journal:
+            self.compact_history()
     
-    def add_search_history(self, user_id: int, query: str, results: int):
-        """Add search to user history"""
-        history = self._load_json(self.history_path)
-        user_id_str = str(user_id)
+    def compact_history(self):
+        """Fold the journal into the snapshot and start a new journal"""
+        snapshot = {user_id_str: list(searches) for user_id_str, searches in self._history.items()}
+        
+        if not write_json_atomic(self.history_path, snapshot):
+            return False
         
-        if user_id_str not in history:
-            history[user_id_str] = []
+        with open(self.journal_path, 'w', encoding='utf-8'):
+            pass
         
-        history[user_id_str].append({
+        self._journal_lines = 0
+        return True
+    
+    def add_search_history(self, user_id: int, query: str, results: int):
+        """Add search to user history"""
+        entry = {
             "query": query,
             "results": results,
             "timestamp": str(datetime.now())
-        })
+        }
         
-        # Keep only last 100 searches per user
-        if len(history[user_id_str]) > 100:
-            history[user_id_str] = history[user_id_str][-100:]
+        self._history[str(user_id)].append(entry)
         
-        self._save_json(self.history_path, history)
+        # Append one line instead of rewriting every user's history
+        try:
+            self._journal.write(json.dumps({"user_id": str(user_id), **entry}, ensure_ascii=False) + "\n")
+            self._journal.flush()
+            self._journal_lines += 1
+        except Exception as e:
+            logger.error(f"Error writing {self.journal_path}: {e}")
     
     def get_user_history(self, user_id: int):
         """Get user search history"""
-        history = self._load_json(self.history_path)
-        return history.get(str(user_id), [])
+        return list(self._history.get(str(user_id), ()))
     
     def is_premium_user(self, user_id: int):
         """Check if user is premium"""
-        premium_db = self._load_json(self.premium_path)
-        return user_id in premium_db.get("premium_users", [])
+        return user_id in self._premium
     
     def add_premium_user(self, user_id: int):
         """Add premium user"""
@@ -248,6 +620,7 @@ class DatabaseManager:
                 self._save_json(self.db_path, db)
             
             self._save_json(self.premium_path, premium_db)
+            self._premium.add(user_id)
             return True
         
         return False
@@ -267,15 +640,28 @@ class DatabaseManager:
                 self._save_json(self.db_path, db)
             
             self._save_json(self.premium_path, premium_db)
+            self._premium.discard(user_id)
             return True
         
         return False
     
     def get_all_users(self):
         """Get all users"""
+        self._flush_last_active()
         db = self._load_json(self.db_path)
         return db.get("users", {})
     
+    def count_active_users(self, since: datetime):
+        """Count users active since the given time"""
+        active = 0
+        
+        for user_data in self.get_all_users().values():
+            last_active = datetime.fromisoformat(user_data.get("last_active", "2020-01-01"))
+            if last_active >= since:
+                active += 1
+        
+        return active
+    
     def get_stats(self):
         """Get bot statistics"""
         db = self._load_json(self.db_path)
@@ -285,40 +671,30 @@ class DatabaseManager:
             "total_users": len(db.get("users", {})),
             "premium_users": premium_db.get("total_premium", 0),
             "free_users": len(db.get("users", {})) - premium_db.get("total_premium", 0),
-            "total_searches": db.get("total_searches", 0),
+            "total_searches": db.get("total_searches", 0) + self.stats_buffer.searches,
             "bot_started": db.get("bot_started", "Unknown")
         }
         
         return stats
     
     def update_user_stats(self, user_id: int, stat_type: str, value: Any):
-        """Update user statistics"""
-        stats = self._load_json(self.stats_path)
-        user_id_str = str(user_id)
-        
-        if user_id_str not in stats:
-            stats[user_id_str] = {
-                "downloads": 0,
-                "favorites": [],
-                "last_download": None
-            }
-        
-        if stat_type == "download":
-            stats[user_id_str]["downloads"] += 1
-            stats[user_id_str]["last_download"] = str(datetime.now())
-        elif stat_type == "favorite":
-            if value not in stats[user_id_str]["favorites"]:
-                stats[user_id_str]["favorites"].append(value)
-        
-        self._save_json(self.stats_path, stats)
+        """Update user statistics (buffered until the next flush)"""
+        self.stats_buffer.record(stat_type, user_id, value)
     
     def export_database(self):
         """Export complete database"""
+        self._flush_stats()
+        
         export_data = {
             "main_database": self._load_json(self.db_path),
             "premium_users": self._load_json(self.premium_path),
-            "search_history": self._load_json(self.history_path),
-            "user_stats": self._load_json(self.stats_path),
+            "search_history": {
+                user_id_str: list(searches) for user_id_str, searches in self._history.items()
+            },
+            "user_stats": {
+                key: value for key, value in self._load_json(self.stats_path).items()
+                if key != STATS_SEQ_KEY
+            },
             "export_time": str(datetime.now()),
             "bot_name": BOT_NAME,
             "creator": BOT_CREATOR
@@ -327,205 +703,2042 @@ class DatabaseManager:
         return export_data
 
 # =============================================================================
-# SESSION MANAGER
+# DATABASE MANAGER CLASS (SQLITE)
 # =============================================================================
 
-class SessionManager:
-    """Manage user sessions"""
+class DatabaseManager:
+    """Handle all database operations on an embedded SQLite database"""
+    
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        );
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            first_name TEXT,
+            last_name TEXT,
+            joined TEXT,
+            last_active TEXT,
+            total_searches INTEGER NOT NULL DEFAULT 0,
+            daily_searches INTEGER NOT NULL DEFAULT 0,
+            last_reset TEXT,
+            is_premium INTEGER NOT NULL DEFAULT 0,
+            is_banned INTEGER NOT NULL DEFAULT 0,
+            language TEXT NOT NULL DEFAULT 'en'
+        );
+        CREATE INDEX IF NOT EXISTS idx_users_last_active ON users (last_active);
+        CREATE TABLE IF NOT EXISTS premium_users (
+            user_id INTEGER PRIMARY KEY,
+            added TEXT
+        );
+        CREATE TABLE IF NOT EXISTS search_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            query TEXT,
+            results INTEGER,
+            timestamp TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_history_user ON search_history (user_id, id);
+        CREATE TABLE IF NOT EXISTS user_stats (
+            user_id INTEGER PRIMARY KEY,
+            downloads INTEGER NOT NULL DEFAULT 0,
+            last_download TEXT
+        );
+        CREATE TABLE IF NOT EXISTS user_favorites (
+            user_id INTEGER NOT NULL,
+            value TEXT NOT NULL,
+            PRIMARY KEY (user_id, value)
+        );
+    """
+    
+    USER_COLUMNS = (
+        "user_id", "username", "first_name", "last_name", "joined", "last_active",
+        "total_searches", "daily_searches", "last_reset", "is_premium", "is_banned", "language"
+    )
     
     def __init__(self):
-        self.sessions = {}
-        self.cache = {}
-    
-    def create_session(self, user_id: int):
-        """Create new session"""
-        self.sessions[user_id] = {
-            "created": datetime.now(),
-            "last_activity": datetime.now(),
-            "state": None,
-            "data": {}
+        self.sqlite_path = SQLITE_DB_PATH
+        self.db_path = DB_PATH
+        self.premium_path = PREMIUM_DB
+        self.history_path = SEARCH_HISTORY_DB
+        self.stats_path = USER_STATS_DB
+        self.conn = sqlite3.connect(self.sqlite_path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self._init_databases()
+        self._migrate_from_json()
+        self._premium = {
+            row["user_id"] for row in self.conn.execute("SELECT user_id FROM premium_users")
         }
+        self.stats_buffer = StatsBuffer(int(self._get_meta("stats_seq", 0)))
+        self._last_active = {}  # user_id -> timestamp not yet written
+        self._last_active_flushed = time.monotonic()
     
-    def get_session(self, user_id: int):
-        """Get user session"""
-        if user_id in self.sessions:
-            self.sessions[user_id]["last_activity"] = datetime.now()
-            return self.sessions[user_id]
-        return None
+    def _init_databases(self):
+        """Initialize schema and bot metadata"""
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        
+        with self.conn:
+            self.conn.executescript(self.SCHEMA)
+            self.conn.execute(
+                "INSERT OR IGNORE INTO meta (key, value) VALUES ('total_searches', '0')"
+            )
+            self.conn.execute(
+                "INSERT OR IGNORE INTO meta (key, value) VALUES ('bot_started', ?)",
+                (str(datetime.now()),)
+            )
+            self.conn.execute(
+                "INSERT OR IGNORE INTO meta (key, value) VALUES ('version', '1.0.0')"
+            )
+    
+    def flush(self, force: bool = False):
+        """Apply buffered counters and, at most once per interval, last_active times"""
+        flushed = 0
+        
+        if force or time.monotonic() - self._last_active_flushed >= LAST_ACTIVE_FLUSH_INTERVAL:
+            flushed += self._flush_last_active()
+        
+        return flushed + self._flush_stats()
     
-    def update_session(self, user_id: int, data: dict):
-        """Update session data"""
-        if user_id not in self.sessions:
-            self.create_session(user_id)
+    def _flush_last_active(self):
+        """Write pending last_active times in one transaction"""
+        self._last_active_flushed = time.monotonic()
+        
+        if not self._last_active:
+            return 0
+        
+        with self.conn:
+            self.conn.executemany(
+                "UPDATE users SET last_active = ? WHERE user_id = ?",
+                [(last_active, user_id) for user_id, last_active in self._last_active.items()]
+            )
         
-        self.sessions[user_id]["data"].update(data)
-        self.sessions[user_id]["last_activity"] = datetime.now()
+        self._last_active.clear()
+        return 1
     
-    def clear_session(self, user_id: int):
-        """Clear user session"""
-        if user_id in self.sessions:
-            del self.sessions[user_id]
+    def _flush_stats(self):
+        """Apply buffered counter deltas in one transaction"""
+        buffer = self.stats_buffer
+        
+        if not buffer.pending():
+            return 0
+        
+        with self.conn:
+            self.conn.execute(
+                "UPDATE meta SET value = CAST(value AS INTEGER) + ? WHERE key = 'total_searches'",
+                (buffer.searches,)
+            )
+            
+            for user_id_str, downloads in buffer.downloads.items():
+                self.conn.execute("INSERT OR IGNORE INTO user_stats (user_id) VALUES (?)", (int(user_id_str),))
+                self.conn.execute(
+                    "UPDATE user_stats SET downloads = downloads + ?, last_download = ? WHERE user_id = ?",
+                    (downloads, buffer.last_download[user_id_str], int(user_id_str))
+                )
+            
+            for user_id_str, values in buffer.favorites.items():
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO user_favorites (user_id, value) VALUES (?, ?)",
+                    [(int(user_id_str), json.dumps(value, ensure_ascii=False)) for value in values]
+                )
+            
+            # Same transaction, so a replayed journal never double counts
+            self.conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('stats_seq', ?)", (str(buffer.seq),)
+            )
+        
+        buffer.clear()
+        return 1
+    
+    def _get_meta(self, key: str, default=None):
+        """Get metadata value"""
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row["value"] if row else default
+    
+    def _load_json(self, filepath):
+        """Load legacy JSON file"""
+        try:
+            with open(filepath, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            logger.error(f"Error loading {filepath}: {e}")
+            return {}
+    
+    def _migrate_from_json(self):
+        """One-time import of the legacy JSON files"""
+        if self._get_meta("json_migrated"):
+            return
+        
+        legacy_files = [self.db_path, self.premium_path, self.history_path, SEARCH_HISTORY_JOURNAL, self.stats_path]
+        
+        if not any(os.path.exists(path) for path in legacy_files):
+            with self.conn:
+                self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('json_migrated', ?)", (str(datetime.now()),))
+            return
+        
+        logger.info("Migrating JSON database to SQLite...")
+        
+        db = self._load_json(self.db_path) if os.path.exists(self.db_path) else {}
+        premium_db = self._load_json(self.premium_path) if os.path.exists(self.premium_path) else {}
+        history = self._load_json(self.history_path) if os.path.exists(self.history_path) else {}
+        
+        # Searches still in the history journal
+        for entry in read_journal(SEARCH_HISTORY_JOURNAL):
+            searches = history.setdefault(entry.pop("user_id"), [])
+            if not searches or entry["timestamp"] > searches[-1]["timestamp"]:
+                searches.append(entry)
+        stats = self._load_json(self.stats_path) if os.path.exists(self.stats_path) else {}
+        
+        with self.conn:
+            # Users
+            for user_id_str, user in db.get("users", {}).items():
+                self.conn.execute(
+                    f"INSERT OR REPLACE INTO users ({', '.join(self.USER_COLUMNS)}) "
+                    f"VALUES ({', '.join('?' * len(self.USER_COLUMNS))})",
+                    (
+                        int(user_id_str),
+                        user.get("username") or "",
+                        user.get("first_name") or "",
+                        user.get("last_name") or "",
+                        user.get("joined", str(datetime.now())),
+                        user.get("last_active", str(datetime.now())),
+                        user.get("total_searches", 0),
+                        user.get("daily_searches", 0),
+                        user.get("last_reset", str(datetime.now().date())),
+                        int(bool(user.get("is_premium", False))),
+                        int(bool(user.get("is_banned", False))),
+                        user.get("language", "en")
+                    )
+                )
+            
+            for key in ("total_searches", "bot_started", "version"):
+                if key in db:
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                        (key, str(db[key]))
+                    )
+            
+            # Premium users
+            for user_id in premium_db.get("premium_users", []):
+                self.conn.execute(
+                    "INSERT OR IGNORE INTO premium_users (user_id, added) VALUES (?, ?)",
+                    (int(user_id), str(datetime.now()))
+                )
+            
+            # Search history
+            for user_id_str, searches in history.items():
+                self.conn.executemany(
+                    "INSERT INTO search_history (user_id, query, results, timestamp) VALUES (?, ?, ?, ?)",
+                    [
+                        (int(user_id_str), s.get("query", ""), s.get("results", 0), s.get("timestamp"))
+                        for s in searches[-SEARCH_HISTORY_LIMIT:]
+                    ]
+                )
+            
+            # User stats
+            for user_id_str, user_stats in stats.items():
+                if user_id_str == STATS_SEQ_KEY:
+                    continue
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO user_stats (user_id, downloads, last_download) VALUES (?, ?, ?)",
+                    (int(user_id_str), user_stats.get("downloads", 0), user_stats.get("last_download"))
+                )
+                for value in user_stats.get("favorites", []):
+                    self.conn.execute(
+                        "INSERT OR IGNORE INTO user_favorites (user_id, value) VALUES (?, ?)",
+                        (int(user_id_str), json.dumps(value, ensure_ascii=False))
+                    )
+            
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('json_migrated', ?)", (str(datetime.now()),))
+        
+        logger.info(f"Migrated {len(db.get('users', {}))} users to {self.sqlite_path}")
+    
+    def _row_to_user(self, row):
+        """Convert users row to the legacy user dict"""
+        if row is None:
+            return None
+        
+        user = dict(row)
+        user["is_premium"] = bool(user["is_premium"])
+        user["is_banned"] = bool(user["is_banned"])
+        return user
+    
+    def add_user(self, user_id: int, user_data: dict):
+        """Add or update user in database"""
+        now = str(datetime.now())
+        
+        # Known user: last_active is written in coalesced batches
+        if self.conn.execute("SELECT 1 FROM users WHERE user_id = ?", (user_id,)).fetchone():
+            self._last_active[user_id] = now
+            return self.get_user(user_id)
+        
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO users (user_id, username, first_name, last_name, joined, "
+                "last_active, last_reset, is_premium) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    user_id,
+                    user_data.get("username") or "",
+                    user_data.get("first_name") or "",
+                    user_data.get("last_name") or "",
+                    now,
+                    now,
+                    str(datetime.now().date()),
+                    int(self.is_premium_user(user_id))
+                )
+            )
+        
+        return self.get_user(user_id)
+    
+    def get_user(self, user_id: int):
+        """Get user from database"""
+        row = self.conn.execute("SELECT * FROM users WHERE user_id = ?", (user_id,)).fetchone()
+        user = self._row_to_user(row)
+        
+        if user is not None and user_id in self._last_active:
+            user["last_active"] = self._last_active[user_id]
+        
+        return user
+    
+    def consume_search_quota(self, user_id: int):
+        """Check the daily limit and count a search in one step"""
+        today = str(datetime.now().date())
+        is_premium = user_id in self._premium
+        
+        with self.conn:
+            # Reset daily limit if needed, then count this search if under the limit
+            cursor = self.conn.execute(
+                "UPDATE users SET "
+                "daily_searches = CASE WHEN date(last_reset) < date(?) THEN 1 ELSE daily_searches + 1 END, "
+                "last_reset = CASE WHEN date(last_reset) < date(?) THEN ? ELSE last_reset END, "
+                "total_searches = total_searches + 1 "
+                "WHERE user_id = ? AND (? OR date(last_reset) < date(?) OR daily_searches < ?)",
+                (today, today, today, user_id, int(is_premium), today, FREE_USER_LIMIT)
+            )
+        
+        if cursor.rowcount:
+            self.stats_buffer.record("search")
+        
+        if cursor.rowcount == 0:
+            if self.get_user(user_id) is not None:
+                return False, 0
+            return True, "unlimited" if is_premium else FREE_USER_LIMIT
+        
+        if is_premium:
+            return True, "unlimited"
+        
+        row = self.conn.execute(
+            "SELECT daily_searches FROM users WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        return True, FREE_USER_LIMIT - row["daily_searches"]
+    
+    def add_search_history(self, user_id: int, query: str, results: int):
+        """Add search to user history"""
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO search_history (user_id, query, results, timestamp) VALUES (?, ?, ?, ?)",
+                (user_id, query, results, str(datetime.now()))
+            )
+            
+            # Keep only last searches per user
+            self.conn.execute(
+                "DELETE FROM search_history WHERE user_id = ? AND id <= ("
+                "SELECT id FROM search_history WHERE user_id = ? ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                (user_id, user_id, SEARCH_HISTORY_LIMIT)
+            )
+    
+    def get_user_history(self, user_id: int):
+        """Get user search history"""
+        rows = self.conn.execute(
+            "SELECT query, results, timestamp FROM search_history WHERE user_id = ? ORDER BY id",
+            (user_id,)
+        ).fetchall()
+        return [dict(row) for row in rows]
+    
+    def is_premium_user(self, user_id: int):
+        """Check if user is premium"""
+        return user_id in self._premium
+    
+    def add_premium_user(self, user_id: int):
+        """Add premium user"""
+        with self.conn:
+            cursor = self.conn.execute(
+                "INSERT OR IGNORE INTO premium_users (user_id, added) VALUES (?, ?)",
+                (user_id, str(datetime.now()))
+            )
+            
+            if cursor.rowcount == 0:
+                return False
+            
+            self.conn.execute("UPDATE users SET is_premium = 1 WHERE user_id = ?", (user_id,))
+        
+        self._premium.add(user_id)
+        return True
+    
+    def remove_premium_user(self, user_id: int):
+        """Remove premium user"""
+        with self.conn:
+            cursor = self.conn.execute("DELETE FROM premium_users WHERE user_id = ?", (user_id,))
+            
+            if cursor.rowcount == 0:
+                return False
+            
+            self.conn.execute("UPDATE users SET is_premium = 0 WHERE user_id = ?", (user_id,))
+        
+        self._premium.discard(user_id)
+        return True
+    
+    def get_all_users(self):
+        """Get all users"""
+        self._flush_last_active()
+        rows = self.conn.execute("SELECT * FROM users").fetchall()
+        return {str(row["user_id"]): self._row_to_user(row) for row in rows}
+    
+    def count_active_users(self, since: datetime):
+        """Count users active since the given time"""
+        self._flush_last_active()
+        row = self.conn.execute(
+            "SELECT COUNT(*) AS n FROM users WHERE last_active >= ?", (str(since),)
+        ).fetchone()
+        return row["n"]
     
-    def cleanup_old_sessions(self, max_age_minutes: int = 30):
-        """Remove old sessions"""
-        current_time = datetime.now()
-        to_remove = []
+    def get_stats(self):
+        """Get bot statistics"""
+        total_users = self.conn.execute("SELECT COUNT(*) AS n FROM users").fetchone()["n"]
+        total_premium = len(self._premium)
+        
+        stats = {
+            "total_users": total_users,
+            "premium_users": total_premium,
+            "free_users": total_users - total_premium,
+            "total_searches": int(self._get_meta("total_searches", 0)) + self.stats_buffer.searches,
+            "bot_started": self._get_meta("bot_started", "Unknown")
+        }
+        
+        return stats
+    
+    def update_user_stats(self, user_id: int, stat_type: str, value: Any):
+        """Update user statistics (buffered until the next flush)"""
+        self.stats_buffer.record(stat_type, user_id, value)
+    
+    def export_database(self):
+        """Export complete database"""
+        self.flush()
+        
+        premium_ids = [
+            row["user_id"] for row in self.conn.execute("SELECT user_id FROM premium_users")
+        ]
+        
+        history = defaultdict(list)
+        for row in self.conn.execute("SELECT * FROM search_history ORDER BY id"):
+            history[str(row["user_id"])].append({
+                "query": row["query"],
+                "results": row["results"],
+                "timestamp": row["timestamp"]
+            })
         
-        for user_id, session in self.sessions.items():
-            age = (current_time - session["last_activity"]).seconds / 60
-            if age > max_age_minutes:
-                to_remove.append(user_id)
+        user_stats = {}
+        for row in self.conn.execute("SELECT * FROM user_stats"):
+            user_stats[str(row["user_id"])] = {
+                "downloads": row["downloads"],
+                "favorites": [],
+                "last_download": row["last_download"]
+            }
+        for row in self.conn.execute("SELECT * FROM user_favorites ORDER BY rowid"):
+            user_stats.setdefault(str(row["user_id"]), {
+                "downloads": 0,
+                "favorites": [],
+                "last_download": None
+            })["favorites"].append(json.loads(row["value"]))
+        
+        export_data = {
+            "main_database": {
+                "users": self.get_all_users(),
+                "total_searches": int(self._get_meta("total_searches", 0)),
+                "bot_started": self._get_meta("bot_started", "Unknown"),
+                "version": self._get_meta("version", "1.0.0")
+            },
+            "premium_users": {
+                "premium_users": premium_ids,
+                "total_premium": len(premium_ids)
+            },
+            "search_history": dict(history),
+            "user_stats": user_stats,
+            "export_time": str(datetime.now()),
+            "bot_name": BOT_NAME,
+            "creator": BOT_CREATOR
+        }
+        
+        return export_data
+
+# =============================================================================
+# SESSION MANAGER
+# =============================================================================
+
+class SessionRecord:
+    """Compact user session: post ids and short titles only"""
+    
+    __slots__ = (
+        "user_id", "state", "query", "result_ids", "result_titles",
+        "game_id", "created", "last_activity", "nbytes"
+    )
+    
+    STATES = (None, "select", "confirm")
+    HEADER = struct.Struct('<qBqddHH')  # user, state, game, created, active, query len, result count
+    
+    def __init__(self, user_id: int):
+        self.user_id = user_id
+        self.state = None
+        self.query = ""
+        self.result_ids = array('q')
+        self.result_titles = ()
+        self.game_id = None
+        self.created = time.time()
+        self.last_activity = self.created
+        self.nbytes = 0
+    
+    def estimate_size(self) -> int:
+        """Approximate memory held by this record"""
+        size = sys.getsizeof(self) + sys.getsizeof(self.query)
+        size += sys.getsizeof(self.result_ids) + sys.getsizeof(self.result_titles)
+        size += sum(sys.getsizeof(title) for title in self.result_titles)
+        return size
+    
+    def to_bytes(self) -> bytes:
+        """Serialize to a packed binary blob"""
+        query = self.query.encode('utf-8')
+        parts = [
+            self.HEADER.pack(
+                self.user_id, self.STATES.index(self.state),
+                -1 if self.game_id is None else self.game_id,
+                self.created, self.last_activity, len(query), len(self.result_ids)
+            ),
+            query,
+            struct.pack(f'<{len(self.result_ids)}q', *self.result_ids)
+        ]
+        
+        for title in self.result_titles:
+            encoded = title.encode('utf-8')
+            parts.append(struct.pack('<H', len(encoded)))
+            parts.append(encoded)
+        
+        return b''.join(parts)
+    
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'SessionRecord':
+        """Deserialize a blob written by to_bytes"""
+        user_id, state, game_id, created, active, query_len, count = cls.HEADER.unpack_from(data)
+        offset = cls.HEADER.size
+        
+        record = cls(user_id)
+        record.state = cls.STATES[state]
+        record.game_id = None if game_id == -1 else game_id
+        record.created = created
+        record.last_activity = active
+        
+        record.query = data[offset:offset + query_len].decode('utf-8')
+        offset += query_len
+        
+        record.result_ids = array('q', struct.unpack_from(f'<{count}q', data, offset))
+        offset += 8 * count
+        
+        titles = []
+        for _ in range(count):
+            (length,) = struct.unpack_from('<H', data, offset)
+            offset += 2
+            titles.append(data[offset:offset + length].decode('utf-8'))
+            offset += length
+        record.result_titles = tuple(titles)
+        
+        return record
+
+
+class MemorySessionBackend:
+    """In-process session store: one LRU bounded by age and bytes"""
+    
+    def __init__(self, max_bytes: int = SESSION_MAX_BYTES, ttl_minutes: int = SESSION_TTL_MINUTES):
+        self.sessions = OrderedDict()  # user_id -> SessionRecord, oldest first
+        self.max_bytes = max_bytes
+        self.ttl = ttl_minutes * 60
+        self.total_bytes = 0
+        self.evicted = 0
+        self.expired = 0
+        
+        # Timing wheel: slot per tick, holds user ids due to expire in that tick
+        self._wheel = [set() for _ in range(int(self.ttl // SESSION_WHEEL_TICK) + 2)]
+        self._last_tick = int(time.time() // SESSION_WHEEL_TICK)
+    
+    def __len__(self):
+        return len(self.sessions)
+    
+    def _is_expired(self, record: SessionRecord, now: float) -> bool:
+        """Check if record outlived the TTL"""
+        return now - record.last_activity >= self.ttl
+    
+    def _slot_index(self, record: SessionRecord) -> int:
+        """Wheel slot of the record's expiry tick"""
+        expiry_tick = int((record.last_activity + self.ttl) // SESSION_WHEEL_TICK) + 1
+        return expiry_tick % len(self._wheel)
+    
+    def _schedule(self, record: SessionRecord):
+        """Put record in the wheel slot of its expiry tick"""
+        self._wheel[self._slot_index(record)].add(record.user_id)
+    
+    def _remove(self, user_id: int):
+        """Drop a record and its byte accounting"""
+        record = self.sessions.pop(user_id, None)
+        
+        if record is not None:
+            self.total_bytes -= record.nbytes
+    
+    async def get(self, user_id: int) -> Optional[SessionRecord]:
+        """Get user session, expiring it lazily if too old"""
+        record = self.sessions.get(user_id)
+        
+        if record is None:
+            return None
+        
+        now = time.time()
+        
+        if self._is_expired(record, now):
+            self._remove(user_id)
+            self.expired += 1
+            return None
+        
+        record.last_activity = now
+        self.sessions.move_to_end(user_id)
+        self._schedule(record)
+        
+        return record
+    
+    async def put(self, record: SessionRecord):
+        """Store record as the most recently used session"""
+        old = self.sessions.get(record.user_id)
+        
+        if old is not None and old is not record:
+            record.created = old.created
+            self._remove(record.user_id)
+        
+        record.last_activity = time.time()
+        self.sessions[record.user_id] = record
+        self.sessions.move_to_end(record.user_id)
+        self._schedule(record)
+        
+        self.total_bytes -= record.nbytes
+        record.nbytes = record.estimate_size()
+        self.total_bytes += record.nbytes
+        
+        # Evict least recently used sessions over the byte budget
+        while self.total_bytes > self.max_bytes and len(self.sessions) > 1:
+            self._remove(next(iter(self.sessions)))
+            self.evicted += 1
+    
+    async def delete(self, user_id: int):
+        """Clear user session"""
+        self._remove(user_id)
+    
+    async def expire_due(self, now: float = None) -> int:
+        """Sweep wheel slots that came due since the last sweep"""
+        now = now or time.time()
+        current_tick = int(now // SESSION_WHEEL_TICK)
+        first_tick = max(self._last_tick + 1, current_tick - len(self._wheel) + 1)
+        removed = 0
+        
+        for tick in range(first_tick, current_tick + 1):
+            index = tick % len(self._wheel)
+            slot = self._wheel[index]
+            
+            for user_id in list(slot):
+                record = self.sessions.get(user_id)
+                
+                if record is not None and self._is_expired(record, now):
+                    self._remove(user_id)
+                    removed += 1
+                elif record is not None and self._slot_index(record) == index:
+                    continue  # Still due here on a later turn
+                
+                # Gone, expired, or rescheduled into another slot
+                slot.discard(user_id)
+        
+        self._last_tick = current_tick
+        self.expired += removed
+        
+        return removed
+    
+    def describe(self) -> str:
+        """Short status line for /admin"""
+        return f"{len(self.sessions)} in memory ({self.total_bytes // 1024} KB)"
+
+
+class KVSessionBackend:
+    """Session store on a Redis-compatible key-value server, shared by all instances"""
+    
+    def __init__(self, host: str = SESSION_KV_HOST, port: int = SESSION_KV_PORT,
+                 prefix: str = SESSION_KV_PREFIX, ttl_minutes: int = SESSION_TTL_MINUTES):
+        self.host = host
+        self.port = port
+        self.prefix = prefix
+        self.ttl = ttl_minutes * 60
+        self.errors = 0
+        self._reader = None
+        self._writer = None
+        self._lock = asyncio.Lock()
+    
+    def _key(self, user_id: int) -> bytes:
+        return f"{self.prefix}{user_id}".encode()
+    
+    @staticmethod
+    def _encode(*args) -> bytes:
+        """Encode a command as a RESP array of bulk strings"""
+        parts = [b'*%d\r\n' % len(args)]
+        
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode()
+            parts.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+        
+        return b''.join(parts)
+    
+    async def _read_reply(self):
+        """Read one RESP reply (simple, error, integer or bulk)"""
+        line = await self._reader.readline()
+        
+        if not line:
+            raise ConnectionError("Session store closed the connection")
+        
+        kind, payload = line[:1], line[1:-2]
+        
+        if kind == b'+':
+            return payload
+        if kind == b'-':
+            raise RuntimeError(payload.decode(errors='replace'))
+        if kind == b':':
+            return int(payload)
+        if kind == b'$':
+            length = int(payload)
+            if length < 0:
+                return None
+            data = await self._reader.readexactly(length + 2)
+            return data[:-2]
+        
+        raise RuntimeError(f"Unsupported reply type: {line!r}")
+    
+    async def _command(self, *args):
+        """Send one command, reconnecting once on a dropped connection"""
+        async with self._lock:
+            for attempt in range(2):
+                try:
+                    if self._writer is None:
+                        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+                    
+                    self._writer.write(self._encode(*args))
+                    await self._writer.drain()
+                    return await self._read_reply()
+                except (ConnectionError, asyncio.IncompleteReadError, OSError):
+                    await self._disconnect()
+                    if attempt:
+                        raise
+                except BaseException:
+                    # A reply may still be unread, never hand this socket to the next caller
+                    self._drop()
+                    raise
+    
+    def _drop(self):
+        """Forget the connection without waiting for it to close"""
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+    
+    async def _disconnect(self):
+        writer = self._writer
+        self._drop()
+        
+        if writer is not None:
+            try:
+                await writer.wait_closed()
+            except Exception:
+                pass
+    
+    async def get(self, user_id: int) -> Optional[SessionRecord]:
+        """Get user session and refresh its TTL in one round trip"""
+        try:
+            data = await self._command('GETEX', self._key(user_id), 'EX', self.ttl)
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Session store get error: {e}")
+            return None
+        
+        if data is None:
+            return None
+        
+        record = SessionRecord.from_bytes(data)
+        record.last_activity = time.time()
+        return record
+    
+    async def put(self, record: SessionRecord):
+        """Store record with the session TTL"""
+        record.last_activity = time.time()
+        
+        try:
+            await self._command('SET', self._key(record.user_id), record.to_bytes(), 'EX', self.ttl)
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Session store set error: {e}")
+    
+    async def delete(self, user_id: int):
+        """Clear user session"""
+        try:
+            await self._command('DEL', self._key(user_id))
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Session store delete error: {e}")
+    
+    async def expire_due(self, now: float = None) -> int:
+        """The server expires keys on its own"""
+        return 0
+    
+    async def close(self):
+        async with self._lock:
+            await self._disconnect()
+    
+    def describe(self) -> str:
+        """Short status line for /admin"""
+        return f"kv://{self.host}:{self.port} ({self.errors} errors)"
+
+
+class LocalKVServer:
+    """In-process stand-in for the session key-value server
+    
+    Speaks the RESP subset KVSessionBackend uses (GET, GETEX, SET, DEL,
+    EXPIRE, DBSIZE, PING) so the networked path runs without a real server.
+    """
+    
+    def __init__(self, host: str = SESSION_KV_HOST, port: int = SESSION_KV_PORT):
+        self.host = host
+        self.port = port
+        self.data = {}  # key -> (value, expires_at or None)
+        self._server = None
+    
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle_client, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"Local session store listening on {self.host}:{self.port}")
+    
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+    
+    def _lookup(self, key: bytes) -> Optional[bytes]:
+        """Get a live value, dropping it if expired"""
+        entry = self.data.get(key)
+        
+        if entry is None:
+            return None
+        
+        value, expires_at = entry
+        
+        if expires_at is not None and expires_at <= time.time():
+            del self.data[key]
+            return None
+        
+        return value
+    
+    @staticmethod
+    def _expiry(args: List[bytes]) -> Optional[float]:
+        """Parse an optional trailing EX seconds"""
+        if len(args) >= 2 and args[0].upper() == b'EX':
+            return time.time() + int(args[1])
+        return None
+    
+    @staticmethod
+    def _bulk(value: Optional[bytes]) -> bytes:
+        if value is None:
+            return b'$-1\r\n'
+        return b'$%d\r\n%s\r\n' % (len(value), value)
+    
+    def _execute(self, args: List[bytes]) -> bytes:
+        """Run one command and return the encoded reply"""
+        command = args[0].upper()
+        
+        if command == b'PING':
+            return b'+PONG\r\n'
+        
+        if command == b'GET':
+            return self._bulk(self._lookup(args[1]))
+        
+        if command == b'GETEX':
+            value = self._lookup(args[1])
+            expires_at = self._expiry(args[2:])
+            if value is not None and expires_at is not None:
+                self.data[args[1]] = (value, expires_at)
+            return self._bulk(value)
+        
+        if command == b'SET':
+            self.data[args[1]] = (args[2], self._expiry(args[3:]))
+            return b'+OK\r\n'
+        
+        if command == b'DEL':
+            removed = 0
+            for key in args[1:]:
+                if self._lookup(key) is not None:
+                    del self.data[key]
+                    removed += 1
+            return b':%d\r\n' % removed
+        
+        if command == b'EXPIRE':
+            value = self._lookup(args[1])
+            if value is None:
+                return b':0\r\n'
+            self.data[args[1]] = (value, time.time() + int(args[2]))
+            return b':1\r\n'
+        
+        if command == b'DBSIZE':
+            for key in list(self.data):
+                self._lookup(key)
+            return b':%d\r\n' % len(self.data)
+        
+        return b'-ERR unknown command\r\n'
+    
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Serve RESP arrays until the client disconnects"""
+        try:
+            while True:
+                line = await reader.readline()
+                
+                if not line:
+                    break
+                
+                if line[:1] != b'*':
+                    writer.write(b'-ERR protocol error\r\n')
+                    break
+                
+                args = []
+                for _ in range(int(line[1:-2])):
+                    header = await reader.readline()
+                    length = int(header[1:-2])
+                    args.append((await reader.readexactly(length + 2))[:-2])
+                
+                try:
+                    writer.write(self._execute(args))
+                except (IndexError, ValueError):
+                    writer.write(b'-ERR wrong number of arguments\r\n')
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+
+class SessionManager:
+    """Session operations used by handlers, on top of a pluggable backend"""
+    
+    def __init__(self, backend):
+        self.backend = backend
+        self.listeners = []  # Called with user_id whenever a session changes
+    
+    def _changed(self, user_id: int):
+        for listener in self.listeners:
+            listener(user_id)
+    
+    async def get_session(self, user_id: int) -> Optional[SessionRecord]:
+        """Get user session, or None if missing or expired"""
+        return await self.backend.get(user_id)
+    
+    async def set_results(self, user_id: int, results: List[dict], query: str = ""):
+        """Store a result list the user can pick from by number"""
+        record = SessionRecord(user_id)
+        record.state = "select"
+        record.query = query
+        record.result_ids = array('q', (r['id'] for r in results))
+        record.result_titles = tuple(r['clean_title'][:SESSION_TITLE_LENGTH] for r in results)
+        self._changed(user_id)
+        await self.backend.put(record)
+    
+    async def set_game(self, user_id: int, game_id: int):
+        """Store the game waiting for download confirmation"""
+        record = SessionRecord(user_id)
+        record.state = "confirm"
+        record.game_id = game_id
+        self._changed(user_id)
+        await self.backend.put(record)
+    
+    async def clear_session(self, user_id: int):
+        """Clear user session"""
+        self._changed(user_id)
+        await self.backend.delete(user_id)
+    
+    async def expire_due(self) -> int:
+        """Sweep expired sessions where the backend needs it"""
+        return await self.backend.expire_due()
+    
+    async def close(self):
+        if hasattr(self.backend, 'close'):
+            await self.backend.close()
+    
+    def describe(self) -> str:
+        return self.backend.describe()
+
+# =============================================================================
+# RESPONSE CACHE
+# =============================================================================
+
+class ResponseCache:
+    """Bounded TTL + LRU cache for API responses"""
+    
+    def __init__(self, max_bytes: int = 0):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> (expires_at, size, data)
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+    
+    @staticmethod
+    def make_key(url: str, params: dict = None) -> str:
+        """Build cache key from URL and normalized params"""
+        if not params:
+            return url
+        
+        normalized = sorted(
+            (str(k), " ".join(str(v).lower().split())) for k, v in params.items()
+        )
+        return url + "?" + "&".join(f"{k}={v}" for k, v in normalized)
+    
+    def get(self, key: str):
+        """Get fresh entry or None"""
+        entry = self.entries.get(key)
+        
+        if entry is None:
+            self.misses += 1
+            return None
+        
+        expires_at, size, data = entry
+        
+        if expires_at < time.monotonic():
+            self._remove(key)
+            self.misses += 1
+            return None
+        
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return data
+    
+    def set(self, key: str, data, size: int, ttl: float):
+        """Store entry and evict least recently used ones over the cap"""
+        if ttl <= 0 or size > self.max_bytes:
+            return
+        
+        if key in self.entries:
+            self._remove(key)
+        
+        self.entries[key] = (time.monotonic() + ttl, size, data)
+        self.total_bytes += size
+        
+        while self.total_bytes > self.max_bytes:
+            oldest_key = next(iter(self.entries))
+            self._remove(oldest_key)
+    
+    def _remove(self, key: str):
+        """Drop entry"""
+        expires_at, size, data = self.entries.pop(key)
+        self.total_bytes -= size
+    
+    def hit_rate(self) -> float:
+        """Hit rate in percent"""
+        total = self.hits + self.misses
+        return (self.hits / total * 100) if total else 0.0
+
+# =============================================================================
+# RATE LIMITER
+# =============================================================================
+
+class TokenBucket:
+    """Async token bucket; callers are served in arrival order without blocking the loop"""
+    
+    WAIT_BUCKETS = (0.0, 0.1, 0.5, 1.0, 2.0, 5.0, 10.0)  # Histogram upper bounds, seconds
+    
+    def __init__(self, rate: float = API_RATE, burst: int = API_BURST):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.wait_counts = [0] * (len(self.WAIT_BUCKETS) + 1)  # Last slot: over the top bound
+        self.total_wait = 0.0
+        self.acquired = 0
+    
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    def try_acquire(self) -> bool:
+        """Take a token only if one is free right now"""
+        self._refill(time.monotonic())
+        
+        if self.tokens < 1:
+            return False
+        
+        self.tokens -= 1
+        self.acquired += 1
+        self.wait_counts[0] += 1
+        return True
+    
+    async def acquire(self):
+        """Take one token, waiting behind earlier callers if the bucket is empty"""
+        self._refill(time.monotonic())
+        
+        # Tokens go negative while callers queue, so each one's wait is
+        # fixed at arrival and later callers can't overtake
+        self.tokens -= 1
+        wait = max(0.0, -self.tokens / self.rate)
+        
+        self.acquired += 1
+        self.total_wait += wait
+        self.wait_counts[bisect.bisect_left(self.WAIT_BUCKETS, wait)] += 1
+        
+        if wait > 0:
+            try:
+                await asyncio.sleep(wait)
+            except asyncio.CancelledError:
+                self.tokens += 1  # Give the reservation back
+                raise
+    
+    def histogram(self) -> str:
+        """Wait-time histogram as one line"""
+        labels = [f"≤{bound:g}s" for bound in self.WAIT_BUCKETS] + [f">{self.WAIT_BUCKETS[-1]:g}s"]
+        return " ".join(f"{label}:{count}" for label, count in zip(labels, self.wait_counts) if count)
+
+# =============================================================================
+# CIRCUIT BREAKER
+# =============================================================================
+
+class CircuitBreaker:
+    """Per-upstream breaker over a rolling window of request outcomes"""
+    
+    def __init__(self, name: str):
+        self.name = name
+        self.state = "closed"  # closed, open or half_open
+        self.outcomes = deque()  # (time, ok) within CIRCUIT_WINDOW
+        self.opened_at = 0.0
+        self.probe_started = 0.0
+        self.trips = 0
+    
+    def _prune(self, now: float):
+        while self.outcomes and now - self.outcomes[0][0] > CIRCUIT_WINDOW:
+            self.outcomes.popleft()
+    
+    def error_rate(self) -> float:
+        """Share of failed requests in the window"""
+        self._prune(time.monotonic())
+        
+        if not self.outcomes:
+            return 0.0
+        
+        return sum(1 for _, ok in self.outcomes if not ok) / len(self.outcomes)
+    
+    def allow(self) -> bool:
+        """Check if a request may go to this upstream"""
+        now = time.monotonic()
+        
+        if self.state == "closed":
+            return True
+        
+        if self.state == "open":
+            if now - self.opened_at < CIRCUIT_OPEN_SECONDS:
+                return False
+            self.state = "half_open"
+            self.probe_started = 0.0
+        
+        # Half open: one probe at a time, a lost probe is retried after a while
+        if self.probe_started and now - self.probe_started < CIRCUIT_OPEN_SECONDS:
+            return False
+        
+        self.probe_started = now
+        return True
+    
+    def record(self, ok: bool):
+        """Record a request outcome and update the state"""
+        now = time.monotonic()
+        
+        if self.state == "half_open":
+            if ok:
+                self.state = "closed"
+                self.outcomes.clear()
+                logger.info(f"Circuit {self.name} closed")
+            else:
+                self._open(now)
+            return
+        
+        self.outcomes.append((now, ok))
+        self._prune(now)
+        
+        if self.state == "closed" and len(self.outcomes) >= CIRCUIT_MIN_REQUESTS:
+            if self.error_rate() >= CIRCUIT_ERROR_RATE:
+                self._open(now)
+    
+    def _open(self, now: float):
+        self.state = "open"
+        self.opened_at = now
+        self.probe_started = 0.0
+        self.trips += 1
+        logger.error(f"Circuit {self.name} opened (error rate {self.error_rate():.0%})")
+    
+    def describe(self) -> str:
+        """Short status line for /admin"""
+        icons = {"closed": "🟢", "half_open": "🟡", "open": "🔴"}
+        return f"{icons[self.state]} {self.state} | errors {self.error_rate():.0%} of {len(self.outcomes)} | trips {self.trips}"
+
+# =============================================================================
+# API MANAGER
+# =============================================================================
+
+# Host whose rate limiter token the current task already holds (background prefetch)
+PREPAID_HOST = contextvars.ContextVar("prepaid_host", default=None)
+
+
+class APIManager:
+    """Handle API requests with retry and fallback"""
+    
+    def __init__(self):
+        self.primary_api = API_BASE
+        self.backup_api = BACKUP_API_BASE
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=API_MAX_CONNECTIONS,
+                max_keepalive_connections=API_MAX_CONNECTIONS
+            ),
+            follow_redirects=True
+        )
+        self.request_count = 0
+        self.limiters = {}  # host -> TokenBucket
+        self.breakers = {
+            self.primary_api: CircuitBreaker("primary"),
+            self.backup_api: CircuitBreaker("backup")
+        }
+        self.cache = ResponseCache(API_CACHE_MAX_BYTES)
+        self._inflight = {}  # cache key -> shared fetch task
+        self._waiters = {}  # shared fetch task -> callers awaiting it
+        self.coalesced_count = 0
+        self.bytes_received = defaultdict(int)  # endpoint kind -> bytes
+        self.responses_received = defaultdict(int)  # endpoint kind -> responses
+        
+    def _get_headers(self):
+        """Get request headers"""
+        return {
+            'User-Agent': random.choice(USER_AGENTS),
+            'Accept': 'application/json',
+            'Accept-Language': 'en-US,en;q=0.9',
+            'Cache-Control': 'no-cache'
+        }
+    
+    def _limiter(self, url: str) -> TokenBucket:
+        """Token bucket of the url's host"""
+        host = urlsplit(url).netloc
+        limiter = self.limiters.get(host)
+        
+        if limiter is None:
+            limiter = TokenBucket(*API_HOST_LIMITS.get(host, (API_RATE, API_BURST)))
+            self.limiters[host] = limiter
+        
+        return limiter
+    
+    def try_reserve(self) -> bool:
+        """Take a free primary API token for the current task's next request, without waiting"""
+        if not self._limiter(self.primary_api).try_acquire():
+            return False
+        
+        PREPAID_HOST.set(urlsplit(self.primary_api).netloc)
+        return True
+    
+    async def _get(self, url: str, params: dict = None, timeout: int = 15) -> httpx.Response:
+        """Rate-limited GET"""
+        if PREPAID_HOST.get() == urlsplit(url).netloc:
+            PREPAID_HOST.set(None)  # One request per reserved token
+        else:
+            await self._limiter(url).acquire()
+        
+        return await self.client.get(
+            url,
+            params=params,
+            headers=self._get_headers(),
+            timeout=timeout
+        )
+    
+    def _endpoint_kind(self, url: str, params: dict = None) -> str:
+        """Classify request for TTLs and traffic stats"""
+        if re.search(r'/posts/\d+$', url):
+            return "post"
+        
+        if params and 'search' in params:
+            return "search"
+        
+        if params and 'page' in params:
+            return "sync"
+        
+        return "list"
+    
+    def _cache_ttl(self, url: str, params: dict = None) -> float:
+        """Pick cache TTL by endpoint"""
+        kind = self._endpoint_kind(url, params)
+        
+        if kind == "post":
+            return API_CACHE_TTL_POST
+        
+        if kind == "search":
+            return API_CACHE_TTL_SEARCH
+        
+        return API_CACHE_TTL_LIST
+    
+    def _with_fields(self, params: dict, fields: str) -> dict:
+        """Add _fields projection when enabled"""
+        if API_FIELD_PROJECTION:
+            params['_fields'] = fields
+        return params
+    
+    async def _make_request(self, url: str, params: dict = None, timeout: int = 15, transform=None):
+        """Make HTTP request, served from cache when fresh"""
+        
+        cache_key = self.cache.make_key(url, params)
+        cached = self.cache.get(cache_key)
+        
+        if cached is not None:
+            return cached
+        
+        # Join identical in-flight request (single-flight)
+        task = self._inflight.get(cache_key)
+        
+        if task is None:
+            task = asyncio.ensure_future(self._fetch_and_cache(cache_key, url, params, timeout, transform))
+            self._inflight[cache_key] = task
+        else:
+            self.coalesced_count += 1
+        
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        
+        # Shield so one cancelled caller doesn't cancel a fetch others still wait on
+        try:
+            return await asyncio.shield(task)
+        finally:
+            self._release(cache_key, task)
+    
+    def _release(self, cache_key: str, task: asyncio.Future):
+        """Drop one caller of a shared fetch, cancelling the fetch once nobody waits for it"""
+        self._waiters[task] -= 1
+        
+        if self._waiters[task]:
+            return
+        
+        del self._waiters[task]
+        
+        if self._inflight.get(cache_key) is task:
+            del self._inflight[cache_key]
+        
+        # No-op once finished, otherwise stops the request or its rate-limit wait
+        task.cancel()
+    
+    async def _fetch_and_cache(self, cache_key: str, url: str, params: dict = None, timeout: int = 15, transform=None):
+        """Fetch from upstream, optionally trim, and store in cache"""
+        
+        response, data = await self._fetch(url, params, timeout)
+        
+        if response is None:
+            return None
+        
+        kind = self._endpoint_kind(url, params)
+        self.bytes_received[kind] += len(response.content)
+        self.responses_received[kind] += 1
+        
+        size = len(response.content)
+        
+        if transform:
+            data = transform(data)
+            size = len(json.dumps(data, ensure_ascii=False))
+        
+        self.cache.set(cache_key, data, size, self._cache_ttl(url, params))
+        
+        return data
+    
+    async def _fetch(self, url: str, params: dict = None, timeout: int = 15):
+        """Make HTTP request with retry, returning the response and its parsed JSON"""
+        
+        self.request_count += 1
+        
+        # Healthy upstreams only, primary first
+        for base, breaker in self.breakers.items():
+            if not breaker.allow():
+                continue
+            
+            try:
+                response = await self._get(url.replace(self.primary_api, base), params, timeout)
+            except Exception as e:
+                breaker.record(False)
+                logger.error(f"{breaker.name.title()} API error: {e}")
+                continue
+            
+            if response.status_code != 200:
+                # Client errors say nothing about upstream health
+                breaker.record(response.status_code < 500 and response.status_code != 429)
+                
+                # WordPress answers 400 past the last page, the backup would say the same
+                if self._is_past_last_page(response):
+                    return response, []
+                
+                continue
+            
+            try:
+                data = response.json()
+            except ValueError as e:
+                # HTML error or maintenance page served with a 200
+                breaker.record(False)
+                logger.error(f"{breaker.name.title()} API bad JSON: {e}")
+                continue
+            
+            breaker.record(True)
+            return response, data
+        
+        return None, None
+    
+    @staticmethod
+    def _is_past_last_page(response: httpx.Response) -> bool:
+        """Check for WordPress's invalid page number error"""
+        if response.status_code != 400:
+            return False
+        
+        try:
+            return response.json().get('code') == 'rest_post_invalid_page_number'
+        except (ValueError, AttributeError):
+            return False
+    
+    def _search_candidates(self, query: str) -> List[str]:
+        """Fallback search queries in priority order"""
+        
+        # Exact search
+        candidates = [query]
+        
+        # Partial search
+        if len(query) > 5:
+            candidates.extend(part for part in query.split() if len(part) > 3)
+        
+        # Without special characters
+        clean_query = re.sub(r'[^\w\s]', '', query)
+        if clean_query != query:
+            candidates.append(clean_query)
+        
+        return list(dict.fromkeys(candidates))
+    
+    def _search_params(self, query: str, limit: int) -> dict:
+        """Params for one search request"""
+        return self._with_fields({
+            'search': query,
+            'per_page': limit
+        }, SEARCH_FIELDS)
+    
+    async def search_games(self, query: str, limit: int = 10):
+        """Search games with fallback"""
+        
+        # Clean query
+        query = query.strip()
+        
+        url = f"{self.primary_api}/posts"
+        candidates = self._search_candidates(query)
+        
+        if not SEARCH_FANOUT:
+            for candidate in candidates:
+                data = await self._make_request(url, self._search_params(candidate, limit))
+                if data:
+                    return data
+            return []
+        
+        # Exact query alone first, so a hit spends a single rate-limit token
+        data = await self._make_request(url, self._search_params(candidates[0], limit))
+        
+        if data or len(candidates) == 1:
+            return data or []
+        
+        return await self._search_fanout(url, candidates[1:], limit)
+    
+    async def _search_fanout(self, url: str, candidates: List[str], limit: int):
+        """Run fallback queries concurrently, first non-empty in priority order wins"""
+        
+        semaphore = asyncio.Semaphore(SEARCH_FANOUT_CONCURRENCY)
+        
+        async def run(candidate):
+            async with semaphore:
+                try:
+                    return await self._make_request(url, self._search_params(candidate, limit))
+                except Exception as e:
+                    logger.error(f"Search fallback error ({candidate}): {e}")
+                    return None
+        
+        tasks = [asyncio.ensure_future(run(candidate)) for candidate in candidates]
+        
+        try:
+            for task in tasks:
+                data = await task
+                if data:
+                    return data
+            return []
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+    
+    async def get_post(self, post_id: int):
+        """Get single post"""
+        url = f"{self.primary_api}/posts/{post_id}"
+        return await self._make_request(url, self._with_fields({}, POST_FIELDS) or None)
+    
+    async def get_latest(self, limit: int = 10):
+        """Get latest posts"""
+        url = f"{self.primary_api}/posts"
+        params = self._with_fields({
+            'per_page': limit,
+            'orderby': 'date',
+            'order': 'desc'
+        }, LIST_FIELDS)
+        return await self._make_request(url, params, transform=trim_list_content)
+    
+    async def get_category(self, category_id: int, limit: int = 10):
+        """Get posts by category"""
+        url = f"{self.primary_api}/posts"
+        params = self._with_fields({
+            'categories': category_id,
+            'per_page': limit,
+            'orderby': 'date',
+            'order': 'desc'
+        }, LIST_FIELDS)
+        return await self._make_request(url, params, transform=trim_list_content)
+    
+    async def get_posts_page(self, page: int, per_page: int = 100, orderby: str = 'date'):
+        """Get one page of posts for catalogue sync"""
+        url = f"{self.primary_api}/posts"
+        params = {
+            'page': page,
+            'per_page': per_page,
+            'orderby': orderby,
+            'order': 'desc',
+            '_fields': SYNC_FIELDS
+        }
+        return await self._make_request(url, params)
+    
+    async def close(self):
+        """Close pooled connections"""
+        await self.client.aclose()
+
+# =============================================================================
+# CATALOG INDEX
+# =============================================================================
+
+class CatalogIndex:
+    """Local inverted index over the post catalogue"""
+    
+    def __init__(self, path: str = CATALOG_INDEX_PATH):
+        self.path = path
+        self.posts = {}  # post_id -> compact post entry
+        self.index = defaultdict(set)  # token -> post ids
+        self.trigrams = defaultdict(set)  # trigram -> tokens
+        self._vocab = []  # Sorted tokens for prefix lookups
+        self._vocab_dirty = False
+        self.last_modified = ""  # Sync stop point, newest edit the modified walk caught up to
+        self.backfill_page = 1  # Next page of the full catalogue walk
+        self.backfill_done = False
+        self.hits = 0
+        self.fuzzy_hits = 0
+        self.misses = 0
+        self._load()
+    
+    @staticmethod
+    def tokenize(text: str) -> List[str]:
+        """Split text into lowercase word tokens, letters and digits apart (gta5 -> gta 5)"""
+        return re.findall(r'[^\W\d_]+|\d+', text.lower())
+    
+    @staticmethod
+    def token_trigrams(token: str) -> set:
+        """Padded character trigrams of a token"""
+        padded = f"  {token} "
+        return {padded[i:i + 3] for i in range(len(padded) - 2)}
+    
+    @staticmethod
+    def edit_distance(a: str, b: str, max_distance: int) -> int:
+        """Levenshtein distance, stops early once above max_distance"""
+        if abs(len(a) - len(b)) > max_distance:
+            return max_distance + 1
+        
+        previous = list(range(len(b) + 1))
+        
+        for i, char_a in enumerate(a, 1):
+            current = [i]
+            for j, char_b in enumerate(b, 1):
+                current.append(min(
+                    previous[j] + 1,
+                    current[j - 1] + 1,
+                    previous[j - 1] + (char_a != char_b)
+                ))
+            if min(current) > max_distance:
+                return max_distance + 1
+            previous = current
+        
+        return previous[-1]
+    
+    def _post_tokens(self, entry: dict) -> set:
+        """Tokens for title, repacker and category names"""
+        tokens = set(self.tokenize(entry['clean_title']))
+        tokens.update(self.tokenize(entry['repacker']))
+        
+        for cat_id in entry['categories']:
+            for group in CATEGORIES.values():
+                name = group.get(cat_id)
+                if name:
+                    tokens.update(self.tokenize(name['name'] if isinstance(name, dict) else name))
+        
+        tokens.discard("unknown")
+        return tokens
+    
+    def _index_entry(self, entry: dict):
+        """Add entry to posting lists"""
+        for token in self._post_tokens(entry):
+            if token not in self.index:
+                self._vocab_dirty = True
+                for trigram in self.token_trigrams(token):
+                    self.trigrams[trigram].add(token)
+            self.index[token].add(entry['id'])
+    
+    def _unindex_entry(self, entry: dict):
+        """Remove entry from posting lists"""
+        for token in self._post_tokens(entry):
+            ids = self.index.get(token)
+            if ids:
+                ids.discard(entry['id'])
+                if not ids:
+                    del self.index[token]
+                    self._vocab_dirty = True
+                    for trigram in self.token_trigrams(token):
+                        self.trigrams[trigram].discard(token)
+    
+    def add_posts(self, posts: List[dict]) -> int:
+        """Add or refresh raw API posts, returns number of changed entries"""
+        changed = 0
+        
+        for post in posts:
+            if 'id' not in post or 'title' not in post:
+                continue
+            
+            title = post['title']['rendered']
+            entry = {
+                'id': post['id'],
+                'title': title,
+                'clean_title': clean_title(title),
+                'repacker': extract_repacker(title),
+                'url': post.get('link', ''),
+                'date': post.get('date', ''),
+                'modified': post.get('modified', ''),
+                'categories': post.get('categories', [])
+            }
+            
+            old = self.posts.get(entry['id'])
+            if old == entry:
+                continue
+            
+            if old:
+                self._unindex_entry(old)
+            
+            self.posts[entry['id']] = entry
+            self._index_entry(entry)
+            changed += 1
+        
+        return changed
+    
+    def _prefix_lookup(self, token: str) -> set:
+        """Post ids for every vocabulary token starting with token"""
+        if self._vocab_dirty:
+            self._vocab = sorted(self.index)
+            self._vocab_dirty = False
+        
+        ids = set()
+        position = bisect.bisect_left(self._vocab, token)
+        
+        while position < len(self._vocab) and self._vocab[position].startswith(token):
+            ids |= self.index[self._vocab[position]]
+            position += 1
+        
+        return ids
+    
+    def _fuzzy_tokens(self, token: str) -> Dict[str, float]:
+        """Vocabulary tokens close to token, with similarity in 0..1"""
+        if len(token) < FUZZY_MIN_TOKEN_LENGTH:
+            return {}
+        
+        query_trigrams = self.token_trigrams(token)
+        shared = defaultdict(int)
+        
+        for trigram in query_trigrams:
+            for candidate in self.trigrams.get(trigram, ()):
+                shared[candidate] += 1
+        
+        max_distance = 1 if len(token) <= 5 else 2
+        close = {}
+        
+        for candidate, count in shared.items():
+            dice = 2 * count / (len(query_trigrams) + len(candidate) + 1)
+            if dice < FUZZY_MIN_SIMILARITY:
+                continue
+            
+            distance = self.edit_distance(token, candidate, max_distance)
+            if distance <= max_distance:
+                close[candidate] = 1 - distance / max(len(token), len(candidate))
+        
+        return close
+    
+    def _match_token(self, token: str) -> Dict[int, float]:
+        """Post id -> match weight for one query token (exact > prefix > fuzzy)"""
+        # Prefix matches include the exact ones, which then get the higher weight
+        weights = dict.fromkeys(self._prefix_lookup(token), 0.8)
+        
+        if weights:
+            for post_id in self.index.get(token, ()):
+                weights[post_id] = 1.0
+            return weights
+        
+        for candidate, similarity in self._fuzzy_tokens(token).items():
+            for post_id in self.index[candidate]:
+                weights[post_id] = max(weights.get(post_id, 0), 0.6 * similarity)
+        
+        return weights
+    
+    def search(self, query: str, limit: int = 10) -> List[dict]:
+        """Find posts matching every query token, best match and newest first"""
+        tokens = list(dict.fromkeys(self.tokenize(query)))
+        
+        if not tokens or not self.posts:
+            return []
+        
+        scores = None
+        fuzzy = False
+        
+        for token in sorted(tokens, key=lambda t: len(self.index.get(t, ()))):
+            weights = self._match_token(token)
+            
+            if weights and token not in self.index and max(weights.values()) < 0.8:
+                fuzzy = True
+            
+            if scores is None:
+                scores = weights
+            else:
+                scores = {post_id: scores[post_id] + weight for post_id, weight in weights.items() if post_id in scores}
+            
+            if not scores:
+                self.misses += 1
+                return []
+        
+        self.hits += 1
+        if fuzzy:
+            self.fuzzy_hits += 1
+        
+        ranked = sorted(scores, key=lambda post_id: (scores[post_id], self.posts[post_id]['date']), reverse=True)
+        return [self.posts[post_id] for post_id in ranked[:limit]]
+    
+    async def sync(self, api: "APIManager", max_pages: int = CATALOG_SYNC_MAX_PAGES) -> int:
+        """Incremental sync: recent changes first, then continue the full backfill"""
+        changed = 0
+        pages = 0
+        known_modified = self.last_modified
+        
+        # Recently published or edited posts. The stop point only moves once
+        # the walk is back at the old one, posts added by searches don't move it
+        newest = known_modified
+        page = 1
+        while pages < max_pages:
+            posts = await api.get_posts_page(page, CATALOG_SYNC_PAGE_SIZE, orderby='modified')
+            pages += 1
+            
+            if posts is None:
+                break
+            
+            changed += self.add_posts(posts)
+            newest = max([newest] + [post.get('modified', '') for post in posts])
+            
+            # First run only needs the newest edit, the backfill fetches everything older
+            if (not known_modified or len(posts) < CATALOG_SYNC_PAGE_SIZE
+                    or posts[-1].get('modified', '') <= known_modified):
+                self.last_modified = newest
+                break
+            
+            page += 1
+        
+        # Walk the rest of the catalogue a few pages per run
+        while not self.backfill_done and pages < max_pages:
+            posts = await api.get_posts_page(self.backfill_page, CATALOG_SYNC_PAGE_SIZE, orderby='date')
+            pages += 1
+            
+            if posts is None:
+                break
+            
+            changed += self.add_posts(posts)
+            self.backfill_page += 1
+            
+            if len(posts) < CATALOG_SYNC_PAGE_SIZE:
+                self.backfill_done = True
+        
+        if changed:
+            self.save()
+        
+        return changed
+    
+    def _load(self):
+        """Load persisted catalogue and rebuild posting lists"""
+        if not os.path.exists(self.path):
+            return
+        
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except Exception as e:
+            logger.error(f"Error loading {self.path}: {e}")
+            return
+        
+        for entry in data.get("posts", []):
+            self.posts[entry['id']] = entry
+            self._index_entry(entry)
+        
+        self.last_modified = data.get("last_modified", "")
+        self.backfill_page = data.get("backfill_page", 1)
+        self.backfill_done = data.get("backfill_done", False)
+        
+        logger.info(f"Loaded catalog index: {len(self.posts)} posts")
+    
+    def save(self):
+        """Persist catalogue to disk"""
+        return write_json_atomic(self.path, {
+            "posts": list(self.posts.values()),
+            "last_modified": self.last_modified,
+            "backfill_page": self.backfill_page,
+            "backfill_done": self.backfill_done
+        }, indent=None)
+
+# =============================================================================
+# GAME DETAIL CACHE
+# =============================================================================
+
+class GameDetailCache:
+    """Parsed game details per post, invalidated by the post's modified time"""
+    
+    def __init__(self, path: str = GAME_CACHE_PATH, max_entries: int = GAME_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # str(post_id) -> {"modified", "cached_at", "details"}
+        self.dirty = False
+        self.hits = 0
+        self.misses = 0
+        self._load()
+    
+    def __contains__(self, post_id: int) -> bool:
+        return str(post_id) in self.entries
+    
+    def get(self, post_id: int, known_modified: str = None) -> Optional[dict]:
+        """Get cached details if still fresh"""
+        key = str(post_id)
+        entry = self.entries.get(key)
+        
+        if entry is None:
+            self.misses += 1
+            return None
+        
+        # Catalogue knows a newer revision, or we can't tell and it's old
+        if known_modified:
+            stale = known_modified > entry["modified"]
+        else:
+            stale = time.time() - entry["cached_at"] > GAME_CACHE_MAX_AGE
+        
+        if stale:
+            del self.entries[key]
+            self.dirty = True
+            self.misses += 1
+            return None
+        
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return dict(entry["details"])
+    
+    def set(self, post_id: int, modified: str, details: dict):
+        """Store parsed details"""
+        key = str(post_id)
+        self.entries[key] = {
+            "modified": modified or "",
+            "cached_at": time.time(),
+            "details": details
+        }
+        self.entries.move_to_end(key)
+        
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        
+        self.dirty = True
+    
+    def _load(self):
+        """Load persisted cache"""
+        if not os.path.exists(self.path):
+            return
+        
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.entries = OrderedDict(json.load(f))
+        except Exception as e:
+            logger.error(f"Error loading {self.path}: {e}")
+    
+    def flush(self):
+        """Persist cache if changed"""
+        if not self.dirty:
+            return False
         
-        for user_id in to_remove:
-            del self.sessions[user_id]
+        if write_json_atomic(self.path, self.entries, indent=None):
+            self.dirty = False
+            return True
         
-        return len(to_remove)
+        return False
 
 # =============================================================================
-# API MANAGER
+# DETAIL PREFETCH
 # =============================================================================
 
-class APIManager:
-    """Handle API requests with retry and fallback"""
+class DetailPrefetcher:
+    """Warm the game detail cache for the top results while the user reads the list"""
     
-    def __init__(self):
-        self.primary_api = API_BASE
-        self.backup_api = BACKUP_API_BASE
-        self.session = requests.Session()
-        self.request_count = 0
-        self.last_request_time = None
-        
-    def _get_headers(self):
-        """Get request headers"""
-        return {
-            'User-Agent': random.choice(USER_AGENTS),
-            'Accept': 'application/json',
-            'Accept-Language': 'en-US,en;q=0.9',
-            'Cache-Control': 'no-cache'
-        }
+    def __init__(self, top_n: int = PREFETCH_TOP_N, concurrency: int = PREFETCH_CONCURRENCY):
+        self.top_n = top_n
+        self._budget = asyncio.Semaphore(concurrency)  # Shared by all users
+        self._tasks = {}  # user_id -> asyncio.Task
+        self.fetched = 0
+        self.skipped = 0
+        self.cancelled = 0
     
-    def _make_request(self, url: str, params: dict = None, timeout: int = 15):
-        """Make HTTP request with retry"""
+    def schedule(self, user_id: int, results: List[dict]):
+        """Start prefetching details for a freshly shown result list"""
+        self.cancel(user_id)
         
-        # Rate limiting
-        if self.last_request_time:
-            elapsed = (datetime.now() - self.last_request_time).seconds
-            if elapsed < 1:
-                time.sleep(1 - elapsed)
+        if not PREFETCH_ENABLED:
+            return
         
-        self.last_request_time = datetime.now()
-        self.request_count += 1
+        game_ids = [r['id'] for r in results[:self.top_n] if r['id'] not in game_cache]
         
-        # Try primary API
-        try:
-            response = self.session.get(
-                url,
-                params=params,
-                headers=self._get_headers(),
-                timeout=timeout
-            )
-            
-            if response.status_code == 200:
-                return response.json()
-                
-        except Exception as e:
-            logger.error(f"Primary API error: {e}")
+        if game_ids:
+            self._tasks[user_id] = asyncio.create_task(self._run(user_id, game_ids))
+    
+    def cancel(self, user_id: int):
+        """Drop the user's pending prefetch, the session moved on"""
+        task = self._tasks.pop(user_id, None)
         
-        # Try backup API
-        try:
-            backup_url = url.replace(self.primary_api, self.backup_api)
-            response = self.session.get(
-                backup_url,
-                params=params,
-                headers=self._get_headers(),
-                timeout=timeout
-            )
+        if task is not None and not task.done():
+            task.cancel()
+            self.cancelled += 1
+    
+    async def _fetch(self, game_id: int):
+        async with self._budget:
+            if game_id in game_cache:
+                return
             
-            if response.status_code == 200:
-                return response.json()
-                
-        except Exception as e:
-            logger.error(f"Backup API error: {e}")
-        
-        return None
+            # Only use a token that is free right now, never queue ahead of foreground requests
+            if not api_manager.try_reserve():
+                self.skipped += 1
+                return
+            
+            if await get_game_details(game_id):
+                self.fetched += 1
     
-    def search_games(self, query: str, limit: int = 10):
-        """Search games with fallback"""
-        
-        # Clean query
-        query = query.strip()
-        
-        # Try exact search
-        url = f"{self.primary_api}/posts"
-        params = {
-            'search': query,
-            'per_page': limit
-        }
-        
-        data = self._make_request(url, params)
+    async def _run(self, user_id: int, game_ids: List[int]):
+        try:
+            await asyncio.gather(*(self._fetch(game_id) for game_id in game_ids))
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.error(f"Prefetch error: {e}")
+        finally:
+            if self._tasks.get(user_id) is asyncio.current_task():
+                del self._tasks[user_id]
+
+# =============================================================================
+# UPDATE PROCESSOR
+# =============================================================================
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Process updates concurrently while keeping each user's updates in order"""
+    
+    def __init__(self, concurrency: int = UPDATE_CONCURRENCY, max_pending: int = UPDATE_MAX_PENDING):
+        # The base semaphore only caps admitted updates, running ones are capped below
+        super().__init__(max(concurrency, max_pending))
+        self.concurrency = concurrency
+        self._slots = asyncio.Semaphore(concurrency)
+        self._locks = {}  # user_id -> asyncio.Lock
+        self.depth = {}  # user_id -> updates queued or running
+        self.running = 0
+        self.peak_depth = 0
+        self.processed = 0
+    
+    async def _run(self, coroutine):
+        """Run one update in a concurrency slot"""
+        async with self._slots:
+            self.running += 1
+            try:
+                await coroutine
+            finally:
+                self.running -= 1
+    
+    async def do_process_update(self, update: object, coroutine):
+        """Wait for the user's earlier updates before taking a concurrency slot"""
+        user = getattr(update, 'effective_user', None)
         
-        if data:
-            return data
+        if user is None:
+            await self._run(coroutine)
+            return
         
-        # Try partial search
-        if len(query) > 5:
-            query_parts = query.split()
-            for part in query_parts:
-                if len(part) > 3:
-                    params['search'] = part
-                    data = self._make_request(url, params)
-                    if data:
-                        return data
-        
-        # Try without special characters
-        clean_query = re.sub(r'[^\w\s]', '', query)
-        if clean_query != query:
-            params['search'] = clean_query
-            data = self._make_request(url, params)
-            if data:
-                return data
+        user_id = user.id
+        lock = self._locks.setdefault(user_id, asyncio.Lock())
+        self.depth[user_id] = self.depth.get(user_id, 0) + 1
+        self.peak_depth = max(self.peak_depth, self.depth[user_id])
         
-        return []
+        try:
+            # Lock waiters are woken in FIFO order, which is arrival order
+            async with lock:
+                await self._run(coroutine)
+        finally:
+            self.processed += 1
+            self.depth[user_id] -= 1
+            
+            if self.depth[user_id] == 0:
+                del self.depth[user_id]
+                del self._locks[user_id]
     
-    def get_post(self, post_id: int):
-        """Get single post"""
-        url = f"{self.primary_api}/posts/{post_id}"
-        return self._make_request(url)
+    async def initialize(self):
+        pass
     
-    def get_latest(self, limit: int = 10):
-        """Get latest posts"""
-        url = f"{self.primary_api}/posts"
-        params = {
-            'per_page': limit,
-            'orderby': 'date',
-            'order': 'desc'
-        }
-        return self._make_request(url, params)
+    async def shutdown(self):
+        pass
     
-    def get_category(self, category_id: int, limit: int = 10):
-        """Get posts by category"""
-        url = f"{self.primary_api}/posts"
-        params = {
-            'categories': category_id,
-            'per_page': limit,
-            'orderby': 'date',
-            'order': 'desc'
-        }
-        return self._make_request(url, params)
+    def waiting(self) -> int:
+        """Updates queued behind an earlier update from the same user"""
+        return sum(depth - 1 for depth in self.depth.values())
+    
+    def deepest(self) -> int:
+        """Current longest per-user queue"""
+        return max(self.depth.values(), default=0)
 
 # =============================================================================
 # INITIALIZE MANAGERS
 # =============================================================================
 
-db_manager = DatabaseManager()
-session_manager = SessionManager()
+db_manager = DatabaseManager() if DB_BACKEND == "sqlite" else JSONDatabaseManager()
+if SESSION_BACKEND == "memory":
+    session_manager = SessionManager(MemorySessionBackend())
+else:
+    session_manager = SessionManager(KVSessionBackend())
+local_kv_server = LocalKVServer() if SESSION_BACKEND == "local-kv" else None
 api_manager = APIManager()
-
-# =============================================================================
-# USER SESSIONS (LEGACY)
-# =============================================================================
-
-user_sessions: Dict[int, dict] = {}
+catalog_index = CatalogIndex()
+game_cache = GameDetailCache()
+update_processor = PerUserUpdateProcessor()
+prefetcher = DetailPrefetcher()
+session_manager.listeners.append(prefetcher.cancel)
 
 # =============================================================================
 # HELPER FUNCTIONS
@@ -548,18 +2761,112 @@ def clean_title(title: str) -> str:
     return title.strip()
 
 
+# Precompiled extraction patterns
+YEAR_PAREN_PATTERN = re.compile(r'\((\d{4})\)')
+YEAR_PATTERN = re.compile(r'\b(20\d{2})\b')
+SIZE_PATTERN = re.compile(r'(\d+\.?\d*)\s*(GB|MB|TB)', re.IGNORECASE)
+SIZE_UNIT_PATTERN = re.compile(r'[GMTgmt][Bb]')
+GDRIVE_PATTERN = re.compile(
+    r'https?://drive\.google\.com/(?:(?P<uc>uc\?[^"\'<>\s]+)|file/d/[^"\'<>\s/]+)'
+)
+GDRIVE_ID_QUERY_PATTERN = re.compile(r'[?&]id=([a-zA-Z0-9_-]+)')
+GDRIVE_ID_PATH_PATTERN = re.compile(r'/d/([a-zA-Z0-9_-]+)')
+PASSWORD_PATTERNS = [
+    re.compile(r'password[:\s]+([^\s<]+)'),
+    re.compile(r'Password[:\s]+([^\s<]+)'),
+    re.compile(r'PASSWORD[:\s]+([^\s<]+)'),
+]
+POSTER_PATTERN = re.compile(r'<img[^>]+src=["\']([^"\']+)["\']')
+DEFAULT_PASSWORD = "www.gamesleech.com"
+
+
+def _find_size(content: str):
+    """First size match, found by jumping between unit letters"""
+    
+    # A size always ends in GB/MB/TB, so only look behind those
+    for unit in SIZE_UNIT_PATTERN.finditer(content):
+        start = unit.start()
+        
+        while start > 0:
+            char = content[start - 1]
+            if char.isdecimal() or char == '.' or char.isspace():
+                start -= 1
+            else:
+                break
+        
+        if start == unit.start():
+            continue
+        
+        match = SIZE_PATTERN.search(content, start, unit.end())
+        if match:
+            return match
+    
+    return None
+
+
+def _clean_gdrive_link(link: str) -> str:
+    """Turn a Google Drive link into a direct download link"""
+    
+    link = link.replace('&amp;', '&')
+    
+    # Extract file ID and create direct link
+    id_match = GDRIVE_ID_QUERY_PATTERN.search(link) or GDRIVE_ID_PATH_PATTERN.search(link)
+    if id_match:
+        return f"https://drive.google.com/uc?export=download&id={id_match.group(1)}"
+    
+    return link
+
+
+def extract_post_fields(content: str) -> dict:
+    """Extract links, password, size and poster from post content in one go"""
+    
+    # Google Drive links: uc?id= links first, then file/d/ links
+    uc_links = []
+    file_links = []
+    
+    for match in GDRIVE_PATTERN.finditer(content):
+        (uc_links if match.group('uc') else file_links).append(match.group(0))
+    
+    gdrive_links = list(dict.fromkeys(_clean_gdrive_link(link) for link in uc_links + file_links))
+    
+    # Password: lowercase label, then Capitalized, then UPPER
+    password = DEFAULT_PASSWORD
+    for pattern in PASSWORD_PATTERNS:
+        match = pattern.search(content)
+        if match:
+            password = match.group(1)
+            break
+    
+    # Size
+    match = _find_size(content)
+    size = f"{match.group(1)} {match.group(2).upper()}" if match else "N/A"
+    
+    # Poster
+    match = POSTER_PATTERN.search(content)
+    poster = match.group(1) if match else ""
+    if poster.startswith('//'):
+        poster = 'https:' + poster
+    
+    return {
+        'gdrive_links': gdrive_links,
+        'password': password,
+        'size': size,
+        'poster': poster
+    }
+
+
 def extract_year(title: str, content: str = "") -> str:
     """Extract year from title or content"""
     
     # Try (2024) pattern
-    match = re.search(r'\((\d{4})\)', title)
+    match = YEAR_PAREN_PATTERN.search(title)
     if match:
         year = match.group(1)
         if 2000 <= int(year) <= 2030:
             return year
     
     # Try standalone year
-    match = re.search(r'\b(20\d{2})\b', title)
+    match = YEAR_PATTERN.search(title)
     if match:
         return match.group(1)
     
@@ -569,13 +2876,31 @@ def extract_year(title: str, content: str = "") -> str:
 def extract_size(content: str) -> str:
     """Extract file size from content"""
     
-    match = re.search(r'(\d+\.?\d*)\s*(GB|MB|TB)', content, re.IGNORECASE)
+    match = _find_size(content)
     if match:
         return f"{match.group(1)} {match.group(2).upper()}"
     
     return "N/A"
 
 
+def trim_list_content(posts):
+    """Reduce each post's rendered content to the size snippet list views need"""
+    
+    if not isinstance(posts, list):
+        return posts
+    
+    trimmed = []
+    for post in posts:
+        content = post.get('content', {}).get('rendered', '')
+        size = extract_size(content)
+        
+        post = dict(post)
+        post['content'] = {'rendered': size if size != "N/A" else ""}
+        trimmed.append(post)
+    
+    return trimmed
+
+
 def extract_repacker(title: str) -> str:
     """Extract repacker name from title"""
     
@@ -588,74 +2913,6 @@ def extract_repacker(title: str) -> str:
     return "Unknown"
 
 
-def extract_gdrive_links(content: str) -> List[str]:
-    """Extract Google Drive links from content"""
-    
-    links = []
-    
-    # Pattern 1: drive.google.com/uc?id=xxx
-    pattern1 = re.findall(r'https?://drive\.google\.com/uc\?[^"\'<>\s]+', content)
-    links.extend(pattern1)
-    
-    # Pattern 2: drive.google.com/file/d/xxx
-    pattern2 = re.findall(r'https?://drive\.google\.com/file/d/[^"\'<>\s/]+', content)
-    links.extend(pattern2)
-    
-    # Clean links
-    clean_links = []
-    for link in links:
-        link = link.replace('&amp;', '&')
-        
-        # Extract file ID and create direct link
-        id_match = re.search(r'[?&]id=([a-zA-Z0-9_-]+)', link)
-        if id_match:
-            file_id = id_match.group(1)
-            clean_links.append(f"https://drive.google.com/uc?export=download&id={file_id}")
-            continue
-        
-        id_match = re.search(r'/d/([a-zA-Z0-9_-]+)', link)
-        if id_match:
-            file_id = id_match.group(1)
-            clean_links.append(f"https://drive.google.com/uc?export=download&id={file_id}")
-            continue
-        
-        clean_links.append(link)
-    
-    # Remove duplicates
-    return list(dict.fromkeys(clean_links))
-
-
-def extract_password(content: str) -> str:
-    """Extract password from content"""
-    
-    patterns = [
-        r'password[:\s]+([^\s<]+)',
-        r'Password[:\s]+([^\s<]+)',
-        r'PASSWORD[:\s]+([^\s<]+)',
-    ]
-    
-    for pattern in patterns:
-        match = re.search(pattern, content)
-        if match:
-            return match.group(1)
-    
-    return "www.gamesleech.com"
-
-
-def extract_poster(content: str, soup=None) -> str:
-    """Extract poster/thumbnail from content"""
-    
-    # Try img src
-    match = re.search(r'<img[^>]+src=["\']([^"\']+)["\']', content)
-    if match:
-        poster = match.group(1)
-        if poster.startswith('//'):
-            poster = 'https:' + poster
-        return poster
-    
-    return ""
-
-
 def validate_user_limits(user_id: int) -> tuple:
     """Check if user can search"""
     
@@ -701,27 +2958,48 @@ def log_user_action(user_id: int, action: str, details: dict = None):
 # SEARCH FUNCTIONS
 # =============================================================================
 
-def search_games(query: str, limit: int = 10) -> List[dict]:
+async def search_games(query: str, limit: int = 10) -> List[dict]:
     """Search games on GamesLeech"""
     
     try:
+        # Try local catalogue first
+        results = [
+            {
+                'id': entry['id'],
+                'title': entry['title'],
+                'clean_title': entry['clean_title'],
+                'url': entry['url'],
+                'date': entry['date']
+            }
+            for entry in catalog_index.search(query, limit)
+        ]
+        
+        # A partial catalogue may be missing matches, let the API fill up the list
+        if results and (catalog_index.backfill_done or len(results) >= limit):
+            return results
+        
         # Use API manager
-        posts = api_manager.search_games(query, limit)
+        posts = await api_manager.search_games(query, limit)
         
         if not posts:
-            return []
+            return results
         
-        results = []
+        # Keep the catalogue fresh with what the API found
+        catalog_index.add_posts(posts)
+        
+        seen = {r['id'] for r in results}
         for post in posts:
-            content = post.get('content', {}).get('rendered', '')
+            if len(results) >= limit:
+                break
+            if post['id'] in seen:
+                continue
             
             results.append({
                 'id': post['id'],
                 'title': post['title']['rendered'],
                 'clean_title': clean_title(post['title']['rendered']),
                 'url': post['link'],
-                'date': post['date'],
-                'content': content
+                'date': post['date']
             })
         
         return results
@@ -731,11 +3009,18 @@ def search_games(query: str, limit: int = 10) -> List[dict]:
         return []
 
 
-def get_game_details(game_id: int) -> Optional[dict]:
+async def get_game_details(game_id: int) -> Optional[dict]:
     """Get full game details"""
     
     try:
-        post = api_manager.get_post(game_id)
+        # Parsed details are reused until the post is modified
+        known_modified = catalog_index.posts.get(game_id, {}).get('modified')
+        cached = game_cache.get(game_id, known_modified)
+        
+        if cached:
+            return cached
+        
+        post = await api_manager.get_post(game_id)
         
         if not post:
             return None
@@ -744,9 +3029,9 @@ def get_game_details(game_id: int) -> Optional[dict]:
         title = post['title']['rendered']
         
         # Extract all info
-        gdrive_links = extract_gdrive_links(content)
+        fields = extract_post_fields(content)
         
-        return {
+        details = {
             'id': post['id'],
             'title': title,
             'clean_title': clean_title(title),
@@ -754,23 +3039,27 @@ def get_game_details(game_id: int) -> Optional[dict]:
             'date': post['date'],
             'year': extract_year(title, content),
             'repacker': extract_repacker(title),
-            'size': extract_size(content),
-            'password': extract_password(content),
-            'poster': extract_poster(content),
-            'gdrive_links': gdrive_links,
-            'parts_count': len(gdrive_links)
+            'size': fields['size'],
+            'password': fields['password'],
+            'poster': fields['poster'],
+            'gdrive_links': fields['gdrive_links'],
+            'parts_count': len(fields['gdrive_links'])
         }
         
+        game_cache.set(game_id, post.get('modified', ''), details)
+        
+        return details
+        
     except Exception as e:
         logger.error(f"Get game error: {e}")
         return None
 
 
-def get_latest_games(limit: int = 10) -> List[dict]:
+async def get_latest_games(limit: int = 10) -> List[dict]:
     """Get latest games"""
     
     try:
-        posts = api_manager.get_latest(limit)
+        posts = await api_manager.get_latest(limit)
         
         if not posts:
             return []
@@ -796,11 +3085,11 @@ def get_latest_games(limit: int = 10) -> List[dict]:
         return []
 
 
-def get_category_games(category_id: int, limit: int = 10) -> List[dict]:
+async def get_category_games(category_id: int, limit: int = 10) -> List[dict]:
     """Get games by category"""
     
     try:
-        posts = api_manager.get_category(category_id, limit)
+        posts = await api_manager.get_category(category_id, limit)
         
         if not posts:
             return []
@@ -847,8 +3136,7 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     db_user = db_manager.add_user(user_id, user_data)
     
     # Clear session
-    user_sessions.pop(user_id, None)
-    session_manager.clear_session(user_id)
+    await session_manager.clear_session(user_id)
     
     # Check if premium
     is_premium = db_manager.is_premium_user(user_id)
@@ -961,8 +3249,8 @@ async def search_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("❌ Too short! Type at least 2 characters.")
         return
     
-    # Check user limits
-    can_search, remaining = validate_user_limits(user_id)
+    # Check and count this search against the daily limit
+    can_search, remaining = db_manager.consume_search_quota(user_id)
     
     if not can_search:
         await update.message.reply_text(
@@ -976,14 +3264,11 @@ async def search_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Log search
     log_user_action(user_id, "search", {"query": query})
     
-    # Update search count
-    db_manager.update_user_searches(user_id)
-    
     # Send searching message
     msg = await update.message.reply_text(f"🔍 Searching: {query}...")
     
     # Search
-    results = search_games(query, limit=8)
+    results = await search_games(query, limit=8)
     
     # Add to history
     db_manager.add_search_history(user_id, query, len(results))
@@ -1000,22 +3285,12 @@ async def search_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     # Save results to session
-    user_sessions[user_id] = {
-        "results": results,
-        "query": query,
-        "state": "select"
-    }
-    
-    session_manager.update_session(user_id, {
-        "results": results,
-        "query": query,
-        "state": "select"
-    })
+    await session_manager.set_results(user_id, results, query)
     
     # Build results text
     limit_text = ""
     if remaining != "unlimited":
-        limit_text = f"\n🔍 Searches remaining: {remaining - 1}/{FREE_USER_LIMIT}"
+        limit_text = f"\n🔍 Searches remaining: {remaining}/{FREE_USER_LIMIT}"
     
     text = f"""🔍 SEARCH RESULTS
 
@@ -1031,6 +3306,9 @@ async def search_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     text += f"👇 Type number 1-{len(results)} to select:"
     
     await msg.edit_text(text)
+    
+    # Warm details for the likely picks
+    prefetcher.schedule(user_id, results)
 
 
 async def number_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -1044,29 +3322,29 @@ async def number_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     num = int(text)
     
-    if user_id not in user_sessions:
+    session = await session_manager.get_session(user_id)
+    
+    if session is None:
         await update.message.reply_text("❌ No active search!\n\nType a game name to search.")
         return
     
-    session = user_sessions[user_id]
-    
-    if "results" not in session:
+    if not session.result_ids:
         await update.message.reply_text("❌ No results found!\n\nType a game name to search.")
         return
     
-    results = session["results"]
+    result_ids = session.result_ids
     
-    if num < 1 or num > len(results):
-        await update.message.reply_text(f"❌ Invalid! Type 1-{len(results)}")
+    if num < 1 or num > len(result_ids):
+        await update.message.reply_text(f"❌ Invalid! Type 1-{len(result_ids)}")
         return
     
-    selected = results[num - 1]
+    selected_id = result_ids[num - 1]
     
     # Log selection
-    log_user_action(user_id, "select_game", {"game_id": selected['id']})
+    log_user_action(user_id, "select_game", {"game_id": selected_id})
     
     # Show game info
-    await show_game_info(update, context, selected['id'])
+    await show_game_info(update, context, selected_id)
 
 
 async def show_game_info(update: Update, context: ContextTypes.DEFAULT_TYPE, game_id: int):
@@ -1079,22 +3357,14 @@ async def show_game_info(update: Update, context: ContextTypes.DEFAULT_TYPE, gam
     msg = await update.message.reply_text("⏳ Loading game details...")
     
     # Get game details
-    game = get_game_details(game_id)
+    game = await get_game_details(game_id)
     
     if not game:
         await msg.edit_text("❌ Failed to load game! Please try again.")
         return
     
     # Save to session
-    user_sessions[user_id] = {
-        "game": game,
-        "state": "confirm"
-    }
-    
-    session_manager.update_session(user_id, {
-        "game": game,
-        "state": "confirm"
-    })
+    await session_manager.set_game(user_id, game['id'])
     
     # Build caption
     caption = f"""🎮 {game['clean_title']}
@@ -1137,6 +3407,28 @@ async def show_game_info(update: Update, context: ContextTypes.DEFAULT_TYPE, gam
     )
 
 
+async def run_with_progress(context: ContextTypes.DEFAULT_TYPE, chat_id: int, coro, text: str):
+    """Await coro, posting a progress message only if it is still pending after a short delay"""
+    
+    task = asyncio.ensure_future(coro)
+    
+    if not SHOW_PROGRESS:
+        return await task, None
+    
+    done, _ = await asyncio.wait({task}, timeout=PROGRESS_DELAY)
+    
+    if done:
+        return task.result(), None
+    
+    try:
+        progress = await context.bot.send_message(chat_id=chat_id, text=text)
+    except Exception as e:
+        logger.error(f"Progress message error: {e}")
+        progress = None
+    
+    return await task, progress
+
+
 async def show_download_links(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show download links"""
     
@@ -1144,11 +3436,27 @@ async def show_download_links(update: Update, context: ContextTypes.DEFAULT_TYPE
     user_id = query.from_user.id
     chat_id = query.message.chat_id
     
-    if user_id not in user_sessions or "game" not in user_sessions[user_id]:
+    session = await session_manager.get_session(user_id)
+    
+    if session is None or session.game_id is None:
         await query.answer("❌ Session expired! Search again.", show_alert=True)
         return
     
-    game = user_sessions[user_id]["game"]
+    # Details come from the game cache, fetched again only if evicted
+    game, progress = await run_with_progress(
+        context, chat_id, get_game_details(session.game_id),
+        "⏳ Fetching download links..."
+    )
+    
+    if progress is not None:
+        try:
+            await progress.delete()
+        except:
+            pass
+    
+    if not game:
+        await query.answer("❌ Failed to load game! Please try again.", show_alert=True)
+        return
     
     # Log download
     log_user_action(user_id, "download", {"game_id": game['id'], "title": game['clean_title']})
@@ -1162,21 +3470,6 @@ async def show_download_links(update: Update, context: ContextTypes.DEFAULT_TYPE
     except:
         pass
     
-    # Send processing message
-    msg = await context.bot.send_message(
-        chat_id=chat_id,
-        text=f"⏳ Fetching download links...\n\n🎮 {game['clean_title']}"
-    )
-    
-    await asyncio.sleep(1)
-    
-    await msg.edit_text(f"📥 Preparing Google Drive links...\n\n🎮 {game['clean_title']}")
-    
-    await asyncio.sleep(1)
-    
-    # Delete processing message
-    await msg.delete()
-    
     # Check if links available
     if not game['gdrive_links']:
         await context.bot.send_message(
@@ -1241,7 +3534,7 @@ Made By {BOT_CREATOR}
                 caption=caption + footer,
                 reply_markup=InlineKeyboardMarkup(keyboard)
             )
-            user_sessions.pop(user_id, None)
+            await session_manager.clear_session(user_id)
             return
         except:
             pass
@@ -1254,7 +3547,7 @@ Made By {BOT_CREATOR}
     )
     
     # Clear session
-    user_sessions.pop(user_id, None)
+    await session_manager.clear_session(user_id)
 
 
 async def show_latest_games(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -1279,17 +3572,14 @@ async def show_latest_games(update: Update, context: ContextTypes.DEFAULT_TYPE):
     log_user_action(user_id, "view_latest")
     
     # Get latest games
-    games = get_latest_games(limit=10)
+    games = await get_latest_games(limit=10)
     
     if not games:
         await query.edit_message_text("❌ Failed to load latest games!")
         return
     
     # Save to session
-    user_sessions[user_id] = {
-        "results": games,
-        "state": "select"
-    }
+    await session_manager.set_results(user_id, games)
     
     # Build text
     text = """🆕 LATEST GAMES
@@ -1309,6 +3599,8 @@ async def show_latest_games(update: Update, context: ContextTypes.DEFAULT_TYPE):
         text=text,
         reply_markup=InlineKeyboardMarkup(keyboard)
     )
+    
+    prefetcher.schedule(user_id, games)
 
 
 async def show_browse_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -1365,17 +3657,14 @@ async def show_category_games(update: Update, context: ContextTypes.DEFAULT_TYPE
     log_user_action(user_id, "browse_category", {"category": cat_id})
     
     # Get category games
-    games = get_category_games(cat_id, limit=10)
+    games = await get_category_games(cat_id, limit=10)
     
     if not games:
         await query.edit_message_text("❌ No games found in this category!")
         return
     
     # Save to session
-    user_sessions[user_id] = {
-        "results": games,
-        "state": "select"
-    }
+    await session_manager.set_results(user_id, games)
     
     # Build text
     text = """📂 CATEGORY GAMES
@@ -1397,6 +3686,8 @@ async def show_category_games(update: Update, context: ContextTypes.DEFAULT_TYPE
         text=text,
         reply_markup=InlineKeyboardMarkup(keyboard)
     )
+    
+    prefetcher.schedule(user_id, games)
 
 
 async def show_user_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -1469,8 +3760,7 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     # Cancel
     if data == "cancel":
-        user_sessions.pop(user_id, None)
-        session_manager.clear_session(user_id)
+        await session_manager.clear_session(user_id)
         await query.answer("Cancelled!")
         try:
             await query.message.delete()
@@ -1485,8 +3775,7 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Back to home
     if data == "back_home":
         await query.answer()
-        user_sessions.pop(user_id, None)
-        session_manager.clear_session(user_id)
+        await session_manager.clear_session(user_id)
         
         is_premium = db_manager.is_premium_user(user_id)
         status_text = "🌟 Premium User" if is_premium else "⭐ Free User"
@@ -1600,6 +3889,12 @@ async def admin_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Get stats
     stats = db_manager.get_stats()
     
+    # Upstream circuit breakers
+    breaker_text = "\n".join(
+        f"• {breaker.name.title()}: {breaker.describe()}"
+        for breaker in api_manager.breakers.values()
+    )
+    
     text = f"""🔧 ADMIN PANEL
 
 👤 Owner: {update.effective_user.first_name}
@@ -1611,7 +3906,10 @@ async def admin_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 • Premium Users: {stats['premium_users']}
 • Free Users: {stats['free_users']}
 • Total Searches: {stats['total_searches']}
-• Active Sessions: {len(user_sessions)}
+• Active Sessions: {session_manager.describe()}
+
+🌐 Upstreams:
+{breaker_text}
 
 ⚙️ Commands:
 /json - Export database
@@ -1731,16 +4029,25 @@ async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     # Get all stats
     stats = db_manager.get_stats()
-    all_users = db_manager.get_all_users()
     
     # Calculate active users (last 24h)
-    active_24h = 0
-    now = datetime.now()
+    active_24h = db_manager.count_active_users(datetime.now() - timedelta(days=1))
     
-    for user_data in all_users.values():
-        last_active = datetime.fromisoformat(user_data.get("last_active", "2020-01-01"))
-        if (now - last_active).days == 0:
-            active_24h += 1
+    # Bytes moved per endpoint kind
+    traffic_lines = []
+    for kind, total_bytes in api_manager.bytes_received.items():
+        responses = api_manager.responses_received[kind]
+        traffic_lines.append(f"• {kind.title()}: {total_bytes / responses / 1024:.1f} KB x {responses}")
+    
+    traffic_text = "\n".join(traffic_lines) or "• No requests yet"
+    
+    # Upstream rate limiter waits per host
+    limiter_lines = []
+    for host, limiter in api_manager.limiters.items():
+        avg_wait = limiter.total_wait / limiter.acquired if limiter.acquired else 0
+        limiter_lines.append(f"• {host}: avg {avg_wait:.2f}s\n  {limiter.histogram()}")
+    
+    limiter_text = "\n".join(limiter_lines) or "• No requests yet"
     
     text = f"""📊 DETAILED STATISTICS
 
@@ -1757,6 +4064,38 @@ async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 • Total: {stats['total_searches']}
 • API Requests: {api_manager.request_count}
 
+🗄️ API Cache:
+• Hits: {api_manager.cache.hits}
+• Misses: {api_manager.cache.misses}
+• Hit Rate: {api_manager.cache.hit_rate():.1f}%
+• Entries: {len(api_manager.cache.entries)} ({api_manager.cache.total_bytes // 1024} KB)
+• Coalesced Requests: {api_manager.coalesced_count}
+
+📦 API Traffic (avg per response):
+{traffic_text}
+
+⏱️ Rate Limiter Waits:
+{limiter_text}
+
+📚 Catalog Index:
+• Posts: {len(catalog_index.posts)}
+• Local Hits: {catalog_index.hits}
+• Fuzzy Hits: {catalog_index.fuzzy_hits}
+• Misses: {catalog_index.misses}
+
+🎮 Game Detail Cache:
+• Cached Games: {len(game_cache.entries)}
+• Hits: {game_cache.hits}
+• Misses: {game_cache.misses}
+• Prefetched: {prefetcher.fetched} (skipped {prefetcher.skipped}, cancelled {prefetcher.cancelled})
+
+⚙️ Update Processing:
+• Running: {update_processor.running}/{update_processor.concurrency}
+• Active Users: {len(update_processor.depth)}
+• Queued Behind Same User: {update_processor.waiting()}
+• Deepest Queue: {update_processor.deepest()} (peak {update_processor.peak_depth})
+• Processed: {update_processor.processed}
+
 ⏰ Bot Started: {stats['bot_started'][:19]}
 
 Made By {BOT_CREATOR}"""
@@ -1827,13 +4166,211 @@ async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def cleanup_task(context: ContextTypes.DEFAULT_TYPE):
     """Periodic cleanup task"""
     
-    # Clean old sessions
-    removed = session_manager.cleanup_old_sessions(30)
+    # Expire sessions due in the timing wheel
+    removed = await session_manager.expire_due()
     
     if removed > 0:
         logger.info(f"Cleaned {removed} old sessions")
 
 
+async def db_flush_task(context: ContextTypes.DEFAULT_TYPE):
+    """Periodic database and cache flush"""
+    
+    flushed = db_manager.flush()
+    
+    if flushed > 0:
+        logger.info(f"Flushed {flushed} database files")
+    
+    game_cache.flush()
+
+
+async def on_startup(application: Application):
+    """Start the local session store when configured"""
+    
+    if local_kv_server is not None:
+        await local_kv_server.start()
+        session_manager.backend.port = local_kv_server.port
+
+
+async def on_shutdown(application: Application):
+    """Final flush and connection cleanup before exit"""
+    
+    db_manager.flush(force=True)
+    game_cache.flush()
+    logger.info("Database flushed on shutdown")
+    
+    await api_manager.close()
+    await session_manager.close()
+    
+    if local_kv_server is not None:
+        await local_kv_server.stop()
+
+
+async def catalog_sync_task(context: ContextTypes.DEFAULT_TYPE):
+    """Periodic catalogue index sync"""
+    
+    changed = await catalog_index.sync(api_manager)
+    
+    if changed > 0:
+        logger.info(f"Catalog sync: {changed} posts updated ({len(catalog_index.posts)} total)")
+
+
+# =============================================================================
+# WEBHOOK SERVER
+# =============================================================================
+
+class WebhookServer:
+    """Minimal HTTP/1.1 server feeding Telegram webhook updates into the application
+    
+    Recorded updates can be replayed locally:
+        curl -H "X-Telegram-Bot-Api-Secret-Token: <secret>" -d @update.json http://127.0.0.1:8443/telegram
+    """
+    
+    REASONS = {200: "OK", 400: "Bad Request", 403: "Forbidden", 404: "Not Found",
+               405: "Method Not Allowed", 413: "Payload Too Large"}
+    
+    def __init__(self, application: Application, listen: str = WEBHOOK_LISTEN,
+                 port: int = WEBHOOK_PORT, path: str = WEBHOOK_PATH,
+                 secret: str = None):
+        self.application = application
+        self.listen = listen
+        self.port = port
+        self.path = path
+        self.secret = secret if secret is not None else webhook_secret()
+        self.received = 0
+        self.rejected = 0
+        self._server = None
+        self._writers = set()  # Open client connections
+    
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle_client, self.listen, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"Webhook server listening on {self.listen}:{self.port}{self.path}")
+    
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            
+            # Telegram keeps its connections open and wait_closed() waits for them (3.12+)
+            for writer in list(self._writers):
+                writer.close()
+            
+            await self._server.wait_closed()
+            self._server = None
+    
+    async def _respond(self, writer: asyncio.StreamWriter, status: int, keep_alive: bool):
+        body = self.REASONS[status].encode()
+        writer.write(
+            f"HTTP/1.1 {status} {self.REASONS[status]}\r\n"
+            f"Content-Type: text/plain\r\nContent-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+    
+    async def _handle_request(self, method: str, target: str, headers: dict, body: bytes) -> int:
+        """Validate one request and queue its update, returning the HTTP status"""
+        if target.split('?', 1)[0] != self.path:
+            return 404
+        if method != "POST":
+            return 405
+        
+        token = headers.get("x-telegram-bot-api-secret-token", "")
+        if not hmac.compare_digest(token.encode(), self.secret.encode()):
+            self.rejected += 1
+            return 403
+        
+        try:
+            update = Update.de_json(json.loads(body), self.application.bot)
+        except Exception as e:
+            logger.error(f"Webhook payload error: {e}")
+            return 400
+        
+        await self.application.update_queue.put(update)
+        self.received += 1
+        return 200
+    
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Serve requests on one keep-alive connection"""
+        self._writers.add(writer)
+        
+        try:
+            while True:
+                request_line = await reader.readline()
+                
+                if not request_line:
+                    break
+                
+                method, target, version = request_line.decode('latin-1').split()
+                headers = {}
+                
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                
+                keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+                length = int(headers.get("content-length", 0))
+                
+                if length > WEBHOOK_MAX_BODY:
+                    await self._respond(writer, 413, False)
+                    break
+                
+                body = await reader.readexactly(length)
+                
+                status = await self._handle_request(method, target, headers, body)
+                
+                await self._respond(writer, status, keep_alive)
+                
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+
+def webhook_secret() -> str:
+    """Configured webhook secret, or one derived from the bot token"""
+    return WEBHOOK_SECRET or hashlib.sha256(BOT_TOKEN.encode()).hexdigest()
+
+
+async def run_webhook(app: Application):
+    """Serve updates from the webhook server until interrupted"""
+    server = WebhookServer(app)
+    stop_event = asyncio.Event()
+    
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except NotImplementedError:
+            pass
+    
+    async with app:
+        # post_init/post_shutdown only run from run_polling/run_webhook
+        await on_startup(app)
+        await app.start()
+        await server.start()
+        
+        if WEBHOOK_URL:
+            await app.bot.set_webhook(
+                url=WEBHOOK_URL.rstrip('/') + WEBHOOK_PATH,
+                secret_token=server.secret,
+                allowed_updates=Update.ALL_TYPES,
+                max_connections=WEBHOOK_WORKERS
+            )
+        
+        try:
+            await stop_event.wait()
+        finally:
+            await server.stop()
+            await app.stop()
+            await on_shutdown(app)
+
+
 # =============================================================================
 # MAIN
 # =============================================================================
@@ -1847,7 +4384,7 @@ def main():
     print("=" * 50)
     
     # Build application
-    app = Application.builder().token(BOT_TOKEN).build()
+    app = Application.builder().token(BOT_TOKEN).concurrent_updates(update_processor).post_init(on_startup).post_shutdown(on_shutdown).build()
     
     # Add handlers
     app.add_handler(CommandHandler("start", start_command))
@@ -1866,14 +4403,19 @@ def main():
     
     # Add jobs
     job_queue = app.job_queue
-    job_queue.run_repeating(cleanup_task, interval=1800, first=10)  # Every 30 minutes
+    job_queue.run_repeating(cleanup_task, interval=SESSION_WHEEL_TICK, first=SESSION_WHEEL_TICK)
+    job_queue.run_repeating(db_flush_task, interval=DB_FLUSH_INTERVAL, first=DB_FLUSH_INTERVAL)
+    job_queue.run_repeating(catalog_sync_task, interval=CATALOG_SYNC_INTERVAL, first=5)
     
     print(f"✅ {BOT_NAME} is running!")
     print(f"Made By {BOT_CREATOR}")
     print("=" * 50)
     
     # Run
-    app.run_polling(allowed_updates=Update.ALL_TYPES)
+    if WEBHOOK_ENABLED:
+        asyncio.run(run_webhook(app))
+    else:
+        app.run_polling(allowed_updates=Update.ALL_TYPES)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,63 @@
+"""CatalogIndex.sync against an in-memory post list
+
+Run from the repo root:
+    python -m pytest -q tests
+"""
+
+import os
+import sys
+import asyncio
+import tempfile
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+# main.py creates its database and log files in the working directory
+_cwd = os.getcwd()
+os.chdir(tempfile.mkdtemp(prefix="test_catalog_sync_"))
+import main  # noqa: E402
+os.chdir(_cwd)
+
+
+class FakeAPI:
+    """Serves get_posts_page from a dict of posts, like WordPress orders them"""
+
+    def __init__(self, posts: dict):
+        self.posts = posts
+
+    async def get_posts_page(self, page: int, per_page: int = 100, orderby: str = 'date'):
+        ordered = sorted(self.posts.values(), key=lambda post: post[orderby], reverse=True)
+        return [dict(post) for post in ordered[(page - 1) * per_page:page * per_page]]
+
+
+def post(post_id: int, title: str, modified: str) -> dict:
+    return {'id': post_id, 'title': {'rendered': title}, 'link': f"https://example.com/{post_id}/",
+            'date': f"2025-01-{post_id:02d}T00:00:00", 'modified': modified}
+
+
+def edit(api: FakeAPI, post_id: int, title: str, modified: str) -> dict:
+    api.posts[post_id] = post(post_id, title, modified)
+    return api.posts[post_id]
+
+
+def test_search_results_do_not_move_the_sync_stop_point(monkeypatch):
+    monkeypatch.setattr(main, "CATALOG_SYNC_PAGE_SIZE", 2)
+    api = FakeAPI({post_id: post(post_id, f"Game {post_id}", f"2025-02-{post_id:02d}T00:00:00")
+                   for post_id in range(1, 6)})
+    catalog = main.CatalogIndex(os.path.join(tempfile.mkdtemp(), "catalog.json"))
+
+    asyncio.run(catalog.sync(api))
+    assert catalog.backfill_done and len(catalog.posts) == 5
+    assert catalog.last_modified == "2025-02-05T00:00:00"
+
+    # Three edits; a search answered by the API picks up the newest one first
+    edit(api, 1, "Game 1 Remastered", "2025-03-01T00:00:00")
+    edit(api, 2, "Game 2 Remastered", "2025-03-02T00:00:00")
+    catalog.add_posts([edit(api, 3, "Game 3 Remastered", "2025-03-03T00:00:00")])
+    assert catalog.last_modified == "2025-02-05T00:00:00"
+
+    asyncio.run(catalog.sync(api))
+
+    assert [catalog.posts[post_id]['clean_title'] for post_id in (1, 2, 3)] == [
+        "Game 1 Remastered", "Game 2 Remastered", "Game 3 Remastered"]
+    assert catalog.last_modified == "2025-03-03T00:00:00"
@@ -0,0 +1,68 @@
+"""Detail prefetch after a search answered by the API, with a stubbed transport
+
+Run from the repo root:
+    python -m pytest -q tests
+"""
+
+import os
+import sys
+import asyncio
+import tempfile
+
+import httpx
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+# main.py creates its database and log files in the working directory
+_cwd = os.getcwd()
+os.chdir(tempfile.mkdtemp(prefix="test_prefetch_"))
+import main  # noqa: E402
+os.chdir(_cwd)
+
+
+def post(post_id: int) -> dict:
+    return {'id': post_id, 'title': {'rendered': f"Elden Ring Part {post_id}"},
+            'link': f"https://example.com/{post_id}/", 'date': "2025-05-30T10:00:00",
+            'modified': "2025-05-30T10:00:00", 'content': {'rendered': "<p>Size: 40 GB</p>"}}
+
+
+def test_api_search_results_get_prefetched():
+    posts = [post(post_id) for post_id in (11, 12, 13, 14)]
+    sent = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        sent.append(request.url.path)
+        if request.url.path.endswith("/posts"):
+            return httpx.Response(200, json=posts)
+        post_id = int(request.url.path.rsplit("/", 1)[1])
+        return httpx.Response(200, json=post(post_id))
+
+    async def runner():
+        api = main.APIManager()
+        await api.client.aclose()
+        api.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        saved = main.api_manager, main.catalog_index, main.game_cache
+        main.api_manager = api
+        main.catalog_index = main.CatalogIndex(os.path.join(tempfile.mkdtemp(), "catalog.json"))
+        main.game_cache = main.GameDetailCache()
+        prefetcher = main.DetailPrefetcher()
+
+        try:
+            results = await main.search_games("elden ring", limit=8)
+            assert [r['id'] for r in results] == [11, 12, 13, 14]
+
+            prefetcher.schedule(1, results)
+            await asyncio.gather(*prefetcher._tasks.values())
+
+            return prefetcher, main.game_cache
+        finally:
+            main.api_manager, main.catalog_index, main.game_cache = saved
+            await api.close()
+
+    prefetcher, game_cache = asyncio.run(runner())
+
+    # The search spent one of the three burst tokens, the other two warm the top results
+    assert sent.count("/wp-json/wp/v2/posts") == 1
+    assert prefetcher.fetched == 2 and prefetcher.skipped == 1
+    assert 11 in game_cache and 12 in game_cache
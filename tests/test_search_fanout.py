@@ -0,0 +1,81 @@
+"""Upstream traffic of APIManager.search_games with a stubbed transport
+
+Run from the repo root:
+    python -m pytest -q tests
+"""
+
+import os
+import sys
+import asyncio
+import tempfile
+
+import httpx
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+# main.py creates its database and log files in the working directory
+_cwd = os.getcwd()
+os.chdir(tempfile.mkdtemp(prefix="test_search_fanout_"))
+import main  # noqa: E402
+os.chdir(_cwd)
+
+
+QUERY = "elden ring nightreign"  # Exact query, then elden, ring and nightreign
+
+
+def post(post_id: int, title: str) -> dict:
+    return {'id': post_id, 'title': {'rendered': title}, 'link': f"https://example.com/{post_id}/",
+            'date': "2025-05-30T10:00:00", 'modified': "2025-05-30T10:00:00"}
+
+
+def run_search(hits: dict, settle: float = 0.0):
+    """Search QUERY against an upstream answering hits[search], return (results, searches sent)"""
+    sent = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        search = request.url.params['search']
+        sent.append(search)
+        await asyncio.sleep(0.05)
+        return httpx.Response(200, json=hits.get(search, []))
+
+    async def runner():
+        api = main.APIManager()
+        await api.client.aclose()
+        api.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+        try:
+            results = await api.search_games(QUERY, limit=8)
+
+            # Anything cancelled must stay cancelled, including requests waiting for a token
+            await asyncio.sleep(settle)
+
+            assert not api._inflight and not api._waiters
+            return results
+        finally:
+            await api.close()
+
+    return asyncio.run(runner()), sent
+
+
+def test_exact_hit_sends_one_request():
+    results, sent = run_search({QUERY: [post(1, "Elden Ring Nightreign")]}, settle=1.2)
+
+    assert [r['id'] for r in results] == [1]
+    assert sent == [QUERY]
+
+
+def test_fallbacks_cancelled_after_first_hit():
+    # Exact query misses, "elden" hits while "nightreign" still waits for a token (burst 3)
+    results, sent = run_search({"elden": [post(2, "Elden Ring")]}, settle=1.2)
+
+    assert [r['id'] for r in results] == [2]
+    assert sent[0] == QUERY
+    assert sorted(sent[1:]) == ["elden", "ring"]
+
+
+def test_miss_tries_every_candidate():
+    results, sent = run_search({})
+
+    assert results == []
+    assert sorted(sent) == sorted([QUERY, "elden", "ring", "nightreign"])
@@ -0,0 +1,111 @@
+"""Round trips through KVSessionBackend against the in-process LocalKVServer
+
+Run from the repo root:
+    python -m pytest -q tests
+"""
+
+import os
+import sys
+import asyncio
+import tempfile
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+# main.py creates its database and log files in the working directory
+_cwd = os.getcwd()
+os.chdir(tempfile.mkdtemp(prefix="test_session_kv_"))
+import main  # noqa: E402
+os.chdir(_cwd)
+
+
+RESULTS = [{'id': 100 + i, 'clean_title': f"Gäme {i}"} for i in range(8)]
+
+
+def run_with_server(scenario):
+    """Run scenario(server, manager) against a fresh local store"""
+    async def runner():
+        server = main.LocalKVServer(port=0)
+        await server.start()
+        manager = main.SessionManager(main.KVSessionBackend(port=server.port))
+        
+        try:
+            await scenario(server, manager)
+        finally:
+            await manager.close()
+            await server.stop()
+    
+    asyncio.run(runner())
+
+
+def test_record_serialization_round_trip():
+    record = main.SessionRecord(42)
+    record.state = "select"
+    record.query = "elden ring"
+    record.result_ids = main.array('q', [r['id'] for r in RESULTS])
+    record.result_titles = tuple(r['clean_title'] for r in RESULTS)
+    
+    copy = main.SessionRecord.from_bytes(record.to_bytes())
+    
+    assert (copy.user_id, copy.state, copy.query, copy.game_id) == (42, "select", "elden ring", None)
+    assert list(copy.result_ids) == list(record.result_ids)
+    assert copy.result_titles == record.result_titles
+
+
+def test_put_get_delete():
+    async def scenario(server, manager):
+        await manager.set_results(1, RESULTS, "elden ring")
+        
+        # A second instance sees the same session
+        other = main.SessionManager(main.KVSessionBackend(port=server.port))
+        session = await other.get_session(1)
+        await other.close()
+        
+        assert session.state == "select"
+        assert session.query == "elden ring"
+        assert list(session.result_ids) == [r['id'] for r in RESULTS]
+        
+        await manager.set_game(1, 105)
+        session = await manager.get_session(1)
+        assert (session.state, session.game_id) == ("confirm", 105)
+        
+        await manager.clear_session(1)
+        assert await manager.get_session(1) is None
+        assert await manager.get_session(2) is None
+    
+    run_with_server(scenario)
+
+
+def test_expiry():
+    async def scenario(server, manager):
+        manager.backend.ttl = 1
+        await manager.set_results(1, RESULTS)
+        
+        await asyncio.sleep(1.2)
+        
+        assert await manager.get_session(1) is None
+        assert await manager.backend._command('DBSIZE') == 0
+    
+    run_with_server(scenario)
+
+
+def test_cancelled_request_does_not_leak_reply():
+    async def scenario(server, manager):
+        await manager.set_results(6, RESULTS, "six")
+        await manager.set_game(7, 7)
+        
+        # Cancel while the reply for user 6 is still on the wire
+        task = asyncio.create_task(manager.get_session(6))
+        for _ in range(3):
+            await asyncio.sleep(0)
+        task.cancel()
+        
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        
+        session = await manager.get_session(7)
+        assert (session.user_id, session.state, session.game_id) == (7, "confirm", 7)
+    
+    run_with_server(scenario)
@@ -0,0 +1,68 @@
+"""WebhookServer requests and shutdown over a real socket
+
+Run from the repo root:
+    python -m pytest -q tests
+"""
+
+import os
+import sys
+import json
+import asyncio
+import tempfile
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+# main.py creates its database and log files in the working directory
+_cwd = os.getcwd()
+os.chdir(tempfile.mkdtemp(prefix="test_webhook_"))
+import main  # noqa: E402
+os.chdir(_cwd)
+
+
+class FakeApplication:
+    bot = None
+
+    def __init__(self):
+        self.update_queue = asyncio.Queue()
+
+
+async def post_update(reader, writer, path: str, secret: str) -> str:
+    """Send one keep-alive request, return the status line"""
+    body = json.dumps({'update_id': 1}).encode()
+    writer.write(
+        f"POST {path} HTTP/1.1\r\nX-Telegram-Bot-Api-Secret-Token: {secret}\r\n"
+        f"Content-Length: {len(body)}\r\n\r\n".encode() + body
+    )
+    await writer.drain()
+
+    status = (await reader.readline()).decode().strip()
+    length = 0
+    while (line := await reader.readline()) != b"\r\n":
+        name, _, value = line.decode().partition(":")
+        if name.lower() == "content-length":
+            length = int(value)
+    await reader.readexactly(length)
+    return status
+
+
+def test_stop_closes_keep_alive_connections():
+    async def runner():
+        application = FakeApplication()
+        server = main.WebhookServer(application, listen="127.0.0.1", port=0, secret="s3cret")
+        await server.start()
+
+        reader, writer = await asyncio.open_connection("127.0.0.1", server.port)
+
+        assert await post_update(reader, writer, server.path, "s3cret") == "HTTP/1.1 200 OK"
+        assert await post_update(reader, writer, server.path, "wrong") == "HTTP/1.1 403 Forbidden"
+        assert application.update_queue.qsize() == 1
+
+        # The connection is still open, like Telegram's
+        await asyncio.wait_for(server.stop(), 2)
+
+        assert await asyncio.wait_for(reader.read(), 2) == b""
+        assert not server._writers
+        writer.close()
+
+    asyncio.run(runner())